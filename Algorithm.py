@@ -1,4 +1,4 @@
-from collections import defaultdict
+from collections import defaultdict, deque
 class UF_by_size:
     def __init__(self):
         self.id = {}
@@ -26,111 +26,1445 @@ class UF_by_size:
             self.id[up] = up = (self.id[deep] if deep in self.id else deep)
         return up
     
-from heapq import heappush, heappop
+from heapq import heappush, heappop, nsmallest
 from math import inf
-# defaultdict version, so that we can add in any amount and any type of item
+from array import array
+from bisect import bisect_left
+import json
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+# interns names to dense integer ids (0, 1, 2, ...), so the graph only works on ints
+    # and the API layer can keep speaking names
+class Name_Table:
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def intern(self, name):
+        if (i := self.ids.get(name)) is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    # return None if this name has never been added
+    def get_id(self, name):
+        return self.ids.get(name)
+
+    def get_name(self, i):
+        return self.names[i]
+
+    def to_names(self, ids):
+        return [self.names[i] for i in ids]
+
+# the first count names of a Name_Table, as a frozen graph knows them (names interned later are unknown to it)
+    # the table is only appended to, so the view never changes
+class Name_View:
+    def __init__(self, table, count):
+        self.ids = table.ids
+        self.names = table.names
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, name):
+        return self.get_id(name) is not None
+
+    def get_id(self, name):
+        if (i := self.ids.get(name)) is not None and i < self.count:
+            return i
+        return None
+
+    def get_name(self, i):
+        return self.names[i]
+
+    def to_names(self, ids):
+        return [self.names[i] for i in ids]
+
+# next column of the edit distance table of query against a name, after reading one more character ch of the name
+def _edit_column(query, col, ch):
+    new = [col[0] + 1]
+    for i, q_ch in enumerate(query, 1):
+        new.append(min(col[i] + 1, new[i - 1] + 1, col[i - 1] + (q_ch != ch)))
+    return new
+
+# edit distance between query and the closest prefix of name (so a query typed halfway still matches)
+    # gives up and returns bound + 1 as soon as every prefix is further than bound
+def fuzzy_prefix_distance(query, name, bound):
+    col = list(range(len(query) + 1)) # distances of query[:i] to the name prefix read so far
+    best = col[-1]
+    for ch in name:
+        if min(col) > bound:
+            break
+        col = _edit_column(query, col, ch)
+        best = min(best, col[-1])
+    return best if best <= bound else bound + 1
+
+# case-insensitive autocomplete over names, a sorted list of (lowercase name, name) searched with bisect
+    # suggest() gives the prefix matches, or the names within a small edit distance when nothing starts with the query
+class Prefix_Index:
+    def __init__(self, names = ()):
+        self.lock = threading.Lock()
+        self.known = set()
+        self.keys = []
+        for name in names:
+            if isinstance(name, str) and name not in self.known:
+                self.known.add(name)
+                self.keys.append((name.lower(), name))
+        self.keys.sort()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, name):
+        if not isinstance(name, str) or name in self.known:
+            return
+        with self.lock:
+            self.known.add(name)
+            self.keys.insert(bisect_left(self.keys, (name.lower(), name)), (name.lower(), name))
+
+    def prefix(self, query, limit):
+        query = query.lower()
+        found = []
+        with self.lock:
+            i = bisect_left(self.keys, (query,))
+            while i < len(self.keys) and len(found) < limit and self.keys[i][0].startswith(query):
+                found.append(self.keys[i][1])
+                i += 1
+        return found
+
+    # [(distance, name), ...] of the closest names (fuzzy_prefix_distance)
+        # max_distance: None - grows with the query, 0 up to 2 characters, 1 up to 4, otherwise 2
+        # the sorted keys are walked like a trie: keys sharing a prefix share its table columns,
+        # and once every entry of a column is beyond max_distance, all keys with that prefix are skipped at once
+    def fuzzy(self, query, limit, max_distance = None):
+        query = query.lower()
+        if max_distance is None:
+            max_distance = max(0, min(2, (len(query) - 1) // 2))
+        with self.lock:
+            keys = list(self.keys)
+        found = []
+        cols = [list(range(len(query) + 1))] # cols[d]: column after the first d characters of prev
+        mins = [0] # mins[d]: smallest entry of cols[d]
+        bests = [cols[0][-1]] # bests[d]: distance to the closest of those prefixes
+        prev = ""
+        i = 0
+        while i < len(keys):
+            key = keys[i][0]
+            depth = 0
+            while depth < min(len(prev), len(key), len(cols) - 1) and prev[depth] == key[depth]:
+                depth += 1
+            del cols[depth + 1:], mins[depth + 1:], bests[depth + 1:]
+            while depth < len(key) and mins[depth] <= max_distance:
+                cols.append(col := _edit_column(query, cols[depth], key[depth]))
+                mins.append(min(col))
+                bests.append(min(bests[depth], col[-1]))
+                depth += 1
+            end = i + 1
+            if mins[depth] > max_distance and end < len(keys) and keys[end][0].startswith(key[:depth]):
+                # every key starting with this prefix has the same distance
+                end = bisect_left(keys, (key[:depth] + chr(0x10FFFF),), end)
+            if bests[depth] <= max_distance:
+                found.extend((bests[depth], len(name), low, name) for low, name in keys[i:end])
+            prev = key
+            i = end
+        return [(dist, name) for dist, _, _, name in nsmallest(limit, found)]
+
+    # (names, fuzzy): prefix matches, otherwise the fuzzy ones closest first
+    def suggest(self, query, limit = 10, max_distance = None):
+        if found := self.prefix(query, limit):
+            return found, False
+        return [name for _, name in self.fuzzy(query, limit, max_distance)], True
+
+# union-find over the dense ids of a Name_Table, parent and size live in flat int arrays
+    # the name methods behave like UF_by_size, the *_id methods skip the name lookup
+    # ids interned after the last call are added lazily as single-member sets
+    # sets with more than one member also keep their member ids, merged small into big like the sets themselves
+class UF_by_array:
+    ID_CODE = "i"
+
+    def __init__(self, names = None):
+        self.names = Name_Table() if names is None else names
+        self.parent = array(self.ID_CODE)
+        self.size = array(self.ID_CODE) # only meaningful for roots
+        self.members = {} # root id -> array of member ids (single-member sets are left out)
+
+    def _grow(self):
+        if (old_cnt := len(self.parent)) < (new_cnt := len(self.names)):
+            self.parent.extend(range(old_cnt, new_cnt))
+            self.size.extend([1] * (new_cnt - old_cnt))
+
+    def find_id(self, u):
+        parent = self.parent
+        if u >= len(parent):
+            return u # not added yet, so it is alone
+        while (p := parent[u]) != u:
+            # path halving
+            parent[u] = u = parent[p]
+        return u
+
+    def union_id(self, u, v):
+        if max(u, v) >= len(self.parent):
+            self._grow()
+        i = self.find_id(u)
+        j = self.find_id(v)
+        if i == j:
+            return
+        # union the smaller set into the bigger set
+        if self.size[i] > self.size[j] :
+            i,j = j,i
+        self.size[j] += self.size[i]
+        self.parent[i] = j
+        self._merge_members(i, j)
+
+    # move the members of root i to root j
+    def _merge_members(self, i, j):
+        members = self.members
+        if (big := members.get(j)) is None:
+            big = members[j] = array(self.ID_CODE, [j])
+        if (small := members.pop(i, None)) is None:
+            big.append(i)
+        else:
+            big.extend(small)
+
+    # bulk union for loading, edges are (id, id) pairs
+    def union_many(self, edges):
+        self._grow()
+        parent, size, merge_members = self.parent, self.size, self._merge_members
+        for u, v in edges:
+            while (p := parent[u]) != u:
+                parent[u] = u = parent[p]
+            while (p := parent[v]) != v:
+                parent[v] = v = parent[p]
+            if u == v:
+                continue
+            if size[u] > size[v]:
+                u, v = v, u
+            size[v] += size[u]
+            parent[u] = v
+            merge_members(u, v)
+
+    def set_size(self, u):
+        if u >= len(self.size):
+            return 1
+        return self.size[self.find_id(u)]
+
+    # member ids of the set of u (do not change the returned array)
+    def members_of(self, u):
+        root = self.find_id(u)
+        if (members := self.members.get(root)) is None:
+            return array(self.ID_CODE, [root])
+        return members
+
+    # iterate (root id, member ids) of every set with more than one member
+    def components(self):
+        return iter(self.members.items())
+
+    def component_cnt(self):
+        return len(self.members)
+
+    # move the given groups of ids (each one a whole new set) out of their set, the ids left keep the old root
+        # only the moved ids and the ids whose parent moved are touched, found by scanning the parent array in C
+        # (many moved ids, or moving the root itself, rewrite the ids left instead)
+    SPLIT_SCAN_LIMIT = 64
+
+    def split_off(self, groups):
+        self._grow()
+        parent, size, members = self.parent, self.size, self.members
+        root = self.find_id(groups[0][0])
+        moved = set().union(*groups)
+        rest = members.pop(root)
+        if root in moved or len(moved) > self.SPLIT_SCAN_LIMIT:
+            rest = array(self.ID_CODE, [u for u in rest if u not in moved])
+            if root in moved:
+                root = rest[0]
+                for u in rest:
+                    parent[u] = root
+            else:
+                for u in rest:
+                    if parent[u] in moved:
+                        parent[u] = root
+        else:
+            for m in moved:
+                i = rest.index(m)
+                rest[i] = rest[-1]
+                rest.pop()
+                # the ids left below a moved id are pointed at the root
+                i = 0
+                while True:
+                    try:
+                        i = parent.index(m, i)
+                    except ValueError:
+                        break
+                    if i not in moved:
+                        parent[i] = root
+                    i += 1
+        size[root] = len(rest)
+        if len(rest) > 1:
+            members[root] = rest
+        for group in groups:
+            group_root = group[0]
+            for u in group:
+                parent[u] = group_root
+            size[group_root] = len(group)
+            if len(group) > 1:
+                members[group_root] = array(self.ID_CODE, group)
+
+    def check_same_union(self, u, v):
+        return self.find(u) == self.find(v)
+
+    def union(self, u, v):
+        self.union_id(self.names.intern(u), self.names.intern(v))
+
+    # a name never added is its own set, like in UF_by_size
+    def find(self, up):
+        if (i := self.names.get_id(up)) is None:
+            return up
+        return self.names.get_name(self.find_id(i))
+
+    # copy of the parents for readers (their path halving only touches the copy), sizes and members are left out
+        # O(n) per call: Backend publishes after every write, so each write copies the whole parent array
+        # (a memcpy, about 0.1 ms at 300k people), copy on first write would not help since a snapshot is always held
+    def freeze(self, names):
+        frozen = UF_by_array(names)
+        frozen.parent = array(self.ID_CODE, self.parent)
+        return frozen
+
+    def nbytes(self):
+        return self.parent.itemsize * (len(self.parent) + len(self.size) + sum(map(len, self.members.values())))
+
+# undirected weighted graph stored as CSR (compressed sparse row) arrays
+    # neighbors of node u are nbrs[offsets[u]:offsets[u+1]] with weights wts[offsets[u]:offsets[u+1]]
+    # rows changed after the last compact() live in self.rows and replace the whole CSR row of that node,
+    # they are merged back into the flat arrays when there are too many of them
+class CSR_Graph:
+    ID_CODE = "i" # node ids (up to 2^31 people)
+    COMPACT_MIN_ROWS = 1024
+
+    def __init__(self, names = None, weight_code = "i"):
+        self.names = Name_Table() if names is None else names
+        self.weight_code = weight_code # connection scores are small integers
+        self.offsets = array("q", [0])
+        self.nbrs = array(self.ID_CODE)
+        self.wts = array(weight_code)
+        self.rows = {} # node id -> (nbrs array, wts array)
+        self.own_rows = set() # rows changed since the last freeze(), only these may be changed in place
+        self.edge_cnt = 0 # undirected edges
+        self.version = 0 # increased on every change of an edge
+        self._set_views()
+
+    # read-only graph over compacted arrays or typed memoryviews (e.g. a shared memory snapshot), nothing is copied
+    @classmethod
+    def from_buffers(cls, offsets, nbrs, wts, names):
+        graph = cls(names, wts.format if isinstance(wts, memoryview) else wts.typecode)
+        graph.offsets, graph.nbrs, graph.wts = offsets, nbrs, wts
+        graph.edge_cnt = len(nbrs) // 2
+        graph._set_views()
+        return graph
+
+    # slicing a memoryview does not copy, so iterating a CSR row does not allocate a new array
+    def _set_views(self):
+        self.nbr_view = memoryview(self.nbrs)
+        self.wt_view = memoryview(self.wts)
+
+    def node_cnt(self):
+        return len(self.names)
+
+    def base_row(self, u):
+        if u + 1 < len(self.offsets):
+            s, e = self.offsets[u], self.offsets[u + 1]
+            return self.nbr_view[s:e], self.wt_view[s:e]
+        return self.nbr_view[0:0], self.wt_view[0:0]
+
+    def row(self, u):
+        if (row := self.rows.get(u)) is not None:
+            return row
+        return self.base_row(u)
+
+    # iterate (neighbor id, weight)
+    def neighbors(self, u):
+        return zip(*self.row(u))
+
+    def degree(self, u):
+        return len(self.row(u)[0])
+
+    def weight(self, u, v):
+        nbrs, wts = self.row(u)
+        for i, nei in enumerate(nbrs):
+            if nei == v:
+                return wts[i]
+        return inf
+
+    # a row this graph may change in place: rows shared with a frozen copy are copied first
+    def _own_row(self, u):
+        if u in self.own_rows:
+            return self.rows[u]
+        nbrs, wts = self.row(u)
+        row = self.rows[u] = (array(self.ID_CODE, nbrs), array(self.weight_code, wts))
+        self.own_rows.add(u)
+        return row
+
+    # set the weight of u -> v, return the old weight (None if it is a new edge)
+    def _set_arc(self, u, v, weight):
+        nbrs, wts = self._own_row(u)
+        try:
+            i = nbrs.index(v)
+        except ValueError:
+            nbrs.append(v)
+            wts.append(weight)
+            return None
+        old_weight = wts[i]
+        wts[i] = weight
+        return old_weight
+
+    # return (id1, id2, old weight)
+    def add_edge(self, n1, n2, weight):
+        u = self.names.intern(n1)
+        v = self.names.intern(n2)
+        old_weight = self._set_arc(u, v, weight)
+        self._set_arc(v, u, weight)
+        if old_weight is None:
+            self.edge_cnt += 1
+        self.version += 1
+        if len(self.rows) > max(self.COMPACT_MIN_ROWS, len(self.offsets) // 2):
+            self.compact()
+        return u, v, old_weight
+
+    # remove u -> v, return the old weight (None if there was no such edge)
+    def _del_arc(self, u, v):
+        if v not in self.row(u)[0]:
+            return None
+        nbrs, wts = self._own_row(u)
+        i = nbrs.index(v)
+        old_weight = wts[i]
+        del nbrs[i]
+        del wts[i]
+        return old_weight
+
+    # return the old weight, or None if u and v were not friends
+    def remove_edge(self, u, v):
+        if (old_weight := self._del_arc(u, v)) is None:
+            return None
+        self._del_arc(v, u)
+        self.edge_cnt -= 1
+        self.version += 1
+        if len(self.rows) > max(self.COMPACT_MIN_ROWS, len(self.offsets) // 2):
+            self.compact()
+        return old_weight
+
+    # return new compacted (offsets, nbrs, wts) arrays of the current graph, the graph itself is not changed
+    def export_arrays(self):
+        offsets = array("q", [0])
+        nbrs = array(self.ID_CODE)
+        wts = array(self.weight_code)
+        for u in range(self.node_cnt()):
+            row_nbrs, row_wts = self.row(u)
+            nbrs.extend(row_nbrs)
+            wts.extend(row_wts)
+            offsets.append(len(nbrs))
+        return offsets, nbrs, wts
+
+    # merge changed rows back into the flat arrays
+    def compact(self):
+        if not self.rows and len(self.offsets) == self.node_cnt() + 1:
+            return
+        self.offsets, self.nbrs, self.wts = self.export_arrays()
+        self.rows = {}
+        self.own_rows = set()
+        self._set_views()
+
+    # read-only copy for readers, which later changes of this graph never touch
+        # the arrays are shared, changed rows are copied by _own_row before the next change
+    def freeze(self):
+        frozen = CSR_Graph.from_buffers(self.offsets, self.nbrs, self.wts, Name_View(self.names, self.node_cnt()))
+        frozen.rows = dict(self.rows)
+        frozen.edge_cnt = self.edge_cnt
+        frozen.version = self.version
+        self.own_rows = set()
+        return frozen
+
+    # ids of nodes which have at least one friend
+    def nodes(self):
+        return (u for u in range(self.node_cnt()) if self.degree(u) > 0)
+
+    # iterate every undirected edge once as (id1, id2, weight)
+    def edges(self):
+        for u in range(self.node_cnt()):
+            for v, w in self.neighbors(u):
+                if u < v:
+                    yield u, v, w
+
+    def nbytes(self):
+        size = sum(arr.itemsize * len(arr) for arr in (self.offsets, self.nbrs, self.wts))
+        for nbrs, wts in self.rows.values():
+            size += nbrs.itemsize * len(nbrs) + wts.itemsize * len(wts)
+        return size
+
+# reusable scratch buffers of the searches (one list per direction), so a query does not build new dicts
+    # an entry is only valid when its stamp equals the current generation, so starting a new query is O(1)
+class Search_Space:
+    NO_PARENT = -1
+
+    def __init__(self, dirs = 2):
+        self.generation = 0
+        self.stamp = [[] for _ in range(dirs)] # generation in which dist/parent was set
+        self.done = [[] for _ in range(dirs)] # generation in which the node was settled
+        self.dist = [[] for _ in range(dirs)]
+        self.parent = [[] for _ in range(dirs)]
+        self.heap = []
+        self.expanded = 0 # nodes settled by the last query
+
+    def new_query(self, node_cnt):
+        if (size := len(self.stamp[0])) < node_cnt:
+            grow = node_cnt - size + node_cnt // 8
+            for d in range(len(self.stamp)):
+                self.stamp[d].extend([0] * grow)
+                self.done[d].extend([0] * grow)
+                self.dist[d].extend([inf] * grow)
+                self.parent[d].extend([self.NO_PARENT] * grow)
+        self.generation += 1
+        self.heap.clear()
+        self.expanded = 0
+        return self.generation
+
+    # node ids from the root of direction d to node
+    def path_to(self, d, node):
+        parent = self.parent[d]
+        path = []
+        while node != self.NO_PARENT:
+            path.append(node)
+            node = parent[node]
+        path.reverse()
+        return path
+
+# free Search_Space objects shared by every thread, a query checks one out and gives it back
+    # so a server starting a thread per request still reuses buffers which already fit the graph
+class Search_Space_Pool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.free = []
+        self.created = 0
+
+    @contextmanager
+    def checkout(self):
+        with self.lock:
+            space = self.free.pop() if self.free else None
+            if space is None:
+                self.created += 1
+        if space is None:
+            space = Search_Space()
+        try:
+            yield space
+        finally:
+            with self.lock:
+                self.free.append(space)
+
+# searches decorated with this get a Search_Space of self.spaces as their first argument
+def _with_space(search):
+    @wraps(search)
+    def run(self, *args, **kwargs):
+        with self.spaces.checkout() as space:
+            space.expanded = 0
+            try:
+                return search(self, space, *args, **kwargs)
+            finally:
+                self._local.expanded = space.expanded
+    return run
+
+# nodes can be any immutable and hashable type, they are interned to dense ids in self.names
     # checked with "https://leetcode.com/problems/path-with-maximum-probability/description/"
 class Bidirectional_Dijkstra:
-    def __init__(self):
+    def __init__(self, weight_code = "i", store = None):
         self.weight_limitation = inf # result weight should be less than this value
-        self.adj_matrix = defaultdict(lambda : defaultdict(lambda : inf))
+        self.store = CSR_Graph(weight_code = weight_code) if store is None else store
+        self.names = self.store.names
+        self.spaces = Search_Space_Pool() # scratch buffers, reused by the queries of every thread
+        self._local = threading.local() # expanded: nodes settled by the last search of this thread
+
+    # the same searches over another store (e.g. a frozen copy), sharing the limitation and the scratch buffers
+    def with_store(self, store):
+        graph = Bidirectional_Dijkstra(store = store)
+        graph.weight_limitation = self.weight_limitation
+        graph.spaces = self.spaces
+        graph._local = self._local
+        return graph
 
     def set_limitation(self, limit):
         self.weight_limitation = limit
 
     def add_edge(self, n1, n2, weight):
-        self.adj_matrix[n1][n2] = weight
-        self.adj_matrix[n2][n1] = weight
+        return self.store.add_edge(n1, n2, weight)
+
+    # return (id1, id2, old weight), or None if they were not friends
+    def remove_edge(self, n1, n2):
+        u, v = self.names.get_id(n1), self.names.get_id(n2)
+        if u is None or v is None or (old_weight := self.store.remove_edge(u, v)) is None:
+            return None
+        return u, v, old_weight
+
+    def compact(self):
+        self.store.compact()
+
+    @property
+    def version(self):
+        return self.store.version
 
     # check having any friends (if no friends, it is impossible to expand friendship)
     def check_data(self, people): 
-        return len(self.adj_matrix[people]) > 0
+        return (u := self.names.get_id(people)) is not None and self.store.degree(u) > 0
+
+    def get_all_nodes(self):
+        return self.names.to_names(self.store.nodes())
+
+    # iterate every undirected edge once as (name1, name2, weight)
+    def get_all_edges(self):
+        get_name = self.names.get_name
+        for u, v, w in self.store.edges():
+            yield get_name(u), get_name(v), w
     
     # return another direction
     # dir: 0 - Forward, 1 - Backward
     def other_dir(self, dir):
         return 1-dir
 
-    def find_min_path(self, start_fri, target_fri):
+    # limit: None - weight_limitation, otherwise the limitation of this query only
+    def find_min_path(self, start_fri, target_fri, limit = None):
         # Handle same person case
         if start_fri == target_fri:
             return (0, [start_fri])
+        start, target = self.names.get_id(start_fri), self.names.get_id(target_fri)
+        if start is None or target is None:
+            return (None, [])
+        min_dist, min_path = self._find_min_path(start, target, limit)
+        if min_dist is None:
+            return (None, [])
+        return (min_dist, self.names.to_names(min_path))
 
-        # using list to memorize both directions' info
-        seen = [set(), set()]
-        dists = [{start_fri: 0}, {target_fri: 0}]  # total distances from start and target node
-        paths = [{start_fri: [start_fri]}, {target_fri: [target_fri]}]  # minimum weight paths to start and target node
-        node_heap = [(0, start_fri, 0), (0, target_fri, 1)]  # heap of (distance, node, dir) for choosing next node to expand
+    # same as find_min_path, but works on node ids
+        # only distances and parents are recorded, the path is built once from the meeting node
+    @_with_space
+    def _find_min_path(self, space, start_fri, target_fri, limit = None):
+        if limit is None:
+            limit = self.weight_limitation
+        neighbors = self.store.neighbors
+        gen = space.new_query(self.store.node_cnt())
+        stamp, done, dists, parent = space.stamp, space.done, space.dist, space.parent
+        for direct, fri in ((0, start_fri), (1, target_fri)):
+            stamp[direct][fri] = gen
+            dists[direct][fri] = 0
+            parent[direct][fri] = Search_Space.NO_PARENT
+        node_heap = space.heap  # heap of (distance, node, dir) for choosing next node to expand
+        node_heap += [(0, start_fri, 0), (0, target_fri, 1)]
 
         min_dist = inf
-        min_path = []
+        meet_fri = None
         while node_heap:
             # get minimum distance to expand
             now_dist, now_fri, direct = heappop(node_heap)
-            if now_dist > dists[direct][now_fri]:
+            dist = dists[direct]
+            if now_dist > dist[now_fri]:
                 # Shortest path to now_fri has already been found
                 continue
-            if now_fri in seen[self.other_dir(direct)]:
+            other = self.other_dir(direct)
+            if done[other][now_fri] == gen:
                 break
-            seen[direct].add(now_fri)
-            for new_fri, new_weight in self.adj_matrix[now_fri].items():
+            done[direct][now_fri] = gen
+            space.expanded += 1
+            dir_stamp, dir_parent = stamp[direct], parent[direct]
+            other_stamp, other_dist = stamp[other], dists[other]
+            for new_fri, new_weight in neighbors(now_fri):
                 new_dist = now_dist + new_weight
-                if new_dist >= self.weight_limitation :
+                if new_dist >= limit :
                     continue
-                if new_dist < dists[direct].get(new_fri, inf):
-                    dists[direct][new_fri] = new_dist
+                if dir_stamp[new_fri] != gen or new_dist < dist[new_fri]:
+                    dir_stamp[new_fri] = gen
+                    dist[new_fri] = new_dist
+                    dir_parent[new_fri] = now_fri
                     heappush(node_heap, (new_dist, new_fri, direct))
-                    paths[direct][new_fri] = paths[direct][now_fri] + [new_fri]
-                    if new_fri in dists[0] and new_fri in dists[1]: # if new_fri connects both sets
+                    if other_stamp[new_fri] == gen: # if new_fri connects both sets
                         # check whether this path is better
-                        totaldist = dists[0][new_fri] + dists[1][new_fri]
-                        if totaldist < self.weight_limitation and min_dist > totaldist:
+                        totaldist = new_dist + other_dist[new_fri]
+                        if totaldist < limit and min_dist > totaldist:
                             min_dist = totaldist
-                            min_path = paths[0][new_fri][:-1] + paths[1][new_fri][::-1]
-                            # since paths[0][new_fri][-1] == paths[1][new_fri][-1]
-        if min_dist == inf:
+                            meet_fri = new_fri
+        if meet_fri is None:
+            return (None, [])
+        return (min_dist, self._join_paths(space, meet_fri))
+
+    # meet_fri is the last node of the forward path and the first node of the backward path
+    def _join_paths(self, space, meet_fri):
+        return space.path_to(0, meet_fri) + space.path_to(1, meet_fri)[-2::-1]
+
+    # number of nodes settled by the last search of this thread
+    def last_expanded(self):
+        return getattr(self._local, "expanded", 0)
+
+    # same as find_min_path, but goal directed (A*) with the lower bounds of landmarks (ALT)
+        # landmarks has to be built from the current graph version
+    def find_min_path_alt(self, start_fri, target_fri, landmarks, limit = None):
+        if start_fri == target_fri:
+            return (0, [start_fri])
+        start, target = self.names.get_id(start_fri), self.names.get_id(target_fri)
+        if start is None or target is None:
+            return (None, [])
+        min_dist, min_path = self._find_min_path_alt(start, target, landmarks, limit)
+        if min_dist is None:
+            return (None, [])
+        return (min_dist, self.names.to_names(min_path))
+
+    # bidirectional A* with the average potential p(v) = (dist_to_target(v) - dist_to_start(v)) / 2
+        # keys are doubled to stay integers: forward 2 * dist + 2p(v), backward 2 * dist - 2p(v)
+        # and the search stops when the sum of both heap tops reaches 2 * min_dist
+    @_with_space
+    def _find_min_path_alt(self, space, start_fri, target_fri, landmarks, limit = None):
+        if not landmarks.same_component(start_fri, target_fri):
             return (None, [])
-        return (min_dist, min_path)
+        neighbors = self.store.neighbors
+        bound = landmarks.bound
+        active = landmarks.active(start_fri, target_fri)
+        gen = space.new_query(self.store.node_cnt())
+        stamp, done, dists, parent = space.stamp, space.done, space.dist, space.parent
+        for direct, fri in ((0, start_fri), (1, target_fri)):
+            stamp[direct][fri] = gen
+            dists[direct][fri] = 0
+            parent[direct][fri] = Search_Space.NO_PARENT
+        heaps = [[], []] # (key, distance, node) of each direction
+        to_target = bound(active, 0, start_fri)
+        heaps[0].append((to_target, 0, start_fri))
+        heaps[1].append((to_target, 0, target_fri))
+
+        min_dist = self.weight_limitation if limit is None else limit
+        meet_fri = None
+        while heaps[0] and heaps[1] and heaps[0][0][0] + heaps[1][0][0] < 2 * min_dist:
+            direct = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            _, now_dist, now_fri = heappop(heaps[direct])
+            dist = dists[direct]
+            if now_dist > dist[now_fri] or done[direct][now_fri] == gen:
+                continue
+            done[direct][now_fri] = gen
+            space.expanded += 1
+            other = self.other_dir(direct)
+            dir_stamp, dir_parent = stamp[direct], parent[direct]
+            other_stamp, other_dist = stamp[other], dists[other]
+            for new_fri, new_weight in neighbors(now_fri):
+                new_dist = now_dist + new_weight
+                if dir_stamp[new_fri] == gen and new_dist >= dist[new_fri]:
+                    continue
+                to_target, to_start = bound(active, 0, new_fri), bound(active, 1, new_fri)
+                # A* pruning: even the lower bound of the remaining part cannot beat min_dist
+                if new_dist + (to_start if direct else to_target) >= min_dist:
+                    continue
+                dir_stamp[new_fri] = gen
+                dist[new_fri] = new_dist
+                dir_parent[new_fri] = now_fri
+                potential = to_target - to_start
+                heappush(heaps[direct], (2 * new_dist + (-potential if direct else potential), new_dist, new_fri))
+                if other_stamp[new_fri] == gen and (totaldist := new_dist + other_dist[new_fri]) < min_dist:
+                    min_dist = totaldist
+                    meet_fri = new_fri
+        if meet_fri is None:
+            return (None, [])
+        return (min_dist, self._join_paths(space, meet_fri))
     
+    # everyone reachable from start with a distance less than limit, as (name, distance) from the closest one
+        # results are generated while searching, so the caller can stop early or page through them
+    def reachable(self, start, limit = None):
+        if limit is None:
+            limit = self.weight_limitation
+        if (start_id := self.names.get_id(start)) is None:
+            return
+        get_name = self.names.get_name
+        for node, dist in self._bounded_search(start_id, limit):
+            if node != start_id:
+                yield get_name(node), dist
+
+    # Dijkstra from start which never goes beyond limit, yields (node id, distance) when a node is settled
+        # fills parent (node id -> previous node id) if given
+    def _bounded_search(self, start, limit, parent = None):
+        neighbors = self.store.neighbors
+        dist = {start: 0}
+        heap = [(0, start)]
+        while heap:
+            now_dist, node = heappop(heap)
+            if now_dist > dist[node]:
+                continue
+            yield node, now_dist
+            for nei, w in neighbors(node):
+                if (new_dist := now_dist + w) < limit and new_dist < dist.get(nei, inf):
+                    dist[nei] = new_dist
+                    if parent is not None:
+                        parent[nei] = node
+                    heappush(heap, (new_dist, nei))
+
+    # answer many targets with one bounded Dijkstra tree from start
+        # return {target id: (distance, path ids)}, targets not reachable within limit are left out
+    def _paths_from(self, start, targets, limit = None):
+        if limit is None:
+            limit = self.weight_limitation
+        parent = {start: Search_Space.NO_PARENT}
+        remaining = set(targets)
+        found = {}
+        for node, dist in self._bounded_search(start, limit, parent):
+            if node in remaining:
+                found[node] = dist
+                remaining.discard(node)
+                if not remaining:
+                    break
+        return {target: (dist, self._tree_path(parent, target)) for target, dist in found.items()}
+
+    # node ids from the root of a search tree to node
+    def _tree_path(self, parent, node):
+        path = []
+        while node != Search_Space.NO_PARENT:
+            path.append(node)
+            node = parent[node]
+        path.reverse()
+        return path
+
+    # after removing edges inside one component, find the parts which broke off from it
+        # one breadth-first search per seed, advanced in turn, searches that meet are merged,
+        # so a removal that splits nothing stops as soon as every seed has met (return None)
+        # a merged group whose searches all ran out is a whole new component, and once only one group is still
+        # searching, it is the rest of the old component: [member ids, ...] of the groups which ran out are returned
+        # (smaller side rule: the work is bounded by the smaller parts, never the biggest one)
+    def split_seeds(self, seeds):
+        neighbors = self.store.neighbors
+        group = list(range(len(seeds))) # search index -> merged into (union-find over the searches)
+        def find(i):
+            while group[i] != i:
+                group[i] = i = group[group[i]]
+            return i
+        owner = {}
+        queues = []
+        members = []
+        group_cnt = 0
+        for i, seed in enumerate(seeds):
+            if seed in owner:
+                group[i] = find(owner[seed])
+            else:
+                owner[seed] = i
+                group_cnt += 1
+            queues.append(deque([seed]) if group[i] == i else deque())
+            members.append([seed] if group[i] == i else [])
+        active = [i for i, queue in enumerate(queues) if queue]
+        while active:
+            if group_cnt == 1:
+                return None
+            if len({find(i) for i in active}) == 1:
+                break
+            still_active = []
+            for i in active:
+                if not (queue := queues[i]):
+                    continue
+                node = queue.popleft()
+                for nei, _ in neighbors(node):
+                    if (j := owner.get(nei)) is None:
+                        owner[nei] = i
+                        members[i].append(nei)
+                        queue.append(nei)
+                    elif (root_j := find(j)) != (root_i := find(i)):
+                        group[root_j] = root_i
+                        group_cnt -= 1
+                if queue:
+                    still_active.append(i)
+            active = still_active
+        if group_cnt == 1:
+            return None
+        components = {}
+        for i in range(len(seeds)):
+            components.setdefault(find(i), []).extend(members[i])
+        if active:
+            # still searching, so its members are not complete
+            del components[find(active[0])]
+        else:
+            # every group ran out, the biggest one keeps the old set
+            del components[max(components, key=lambda root: len(components[root]))]
+        return list(components.values())
+
+    # the k shortest loopless paths (Yen's algorithm) from start to target with a distance less than limit
+        # return [(distance, path), ...] from the shortest one
+    def k_shortest_paths(self, start, target, k, limit = None):
+        if start == target:
+            return [(0, [start])]
+        start_id, target_id = self.names.get_id(start), self.names.get_id(target)
+        if start_id is None or target_id is None:
+            return []
+        return [(dist, self.names.to_names(path)) for dist, path in self._k_shortest_paths(start_id, target_id, k, limit)]
+
+    # every spur search is an A* guided by the exact distances to target, computed once by one bounded search tree
+        # (removing nodes and edges only makes distances longer, so they stay admissible)
+        # nodes farther than limit from target are never visited
+    def _k_shortest_paths(self, start, target, k, limit = None):
+        if limit is None:
+            limit = self.weight_limitation
+        parent = {target: Search_Space.NO_PARENT}
+        to_target = dict(self._bounded_search(target, limit, parent))
+        if start not in to_target:
+            return []
+        weight = self.store.weight
+        found = [(to_target[start], self._tree_path(parent, start)[::-1])]
+        candidates = [] # heap of (distance, path)
+        seen = {tuple(found[0][1])}
+        while len(found) < k:
+            prev_path = found[-1][1]
+            root_len = 0
+            for i, spur in enumerate(prev_path[:-1]):
+                root = prev_path[:i + 1]
+                # only candidates better than the ones we already have can matter
+                bound = limit
+                if len(found) + len(candidates) >= k:
+                    bound = min(bound, nsmallest(k - len(found), candidates)[-1][0])
+                banned_nodes = set(root[:-1])
+                banned_edges = {path[i + 1] for _, path in found if len(path) > i + 1 and path[:i + 1] == root}
+                spur_ret = self._spur_search(spur, target, banned_nodes, banned_edges, to_target, bound - root_len)
+                if spur_ret is not None:
+                    spur_len, spur_path = spur_ret
+                    path = root[:-1] + spur_path
+                    if (key := tuple(path)) not in seen:
+                        seen.add(key)
+                        heappush(candidates, (root_len + spur_len, path))
+                root_len += weight(spur, prev_path[i + 1])
+            if not candidates:
+                break
+            found.append(heappop(candidates))
+        return found
+
+    # A* from spur to target avoiding banned nodes and the edges spur -> banned_edges
+        # return (distance, path ids) if there is a path shorter than limit, otherwise None
+    def _spur_search(self, spur, target, banned_nodes, banned_edges, to_target, limit):
+        neighbors = self.store.neighbors
+        dist = {spur: 0}
+        parent = {spur: Search_Space.NO_PARENT}
+        heap = [(to_target[spur], 0, spur)]
+        while heap:
+            _, now_dist, node = heappop(heap)
+            if now_dist > dist[node]:
+                continue
+            if node == target:
+                return (now_dist, self._tree_path(parent, target))
+            for nei, w in neighbors(node):
+                if nei in banned_nodes or (node == spur and nei in banned_edges):
+                    continue
+                # nodes without a distance to target are farther than the limitation
+                if (h := to_target.get(nei)) is None or (new_dist := now_dist + w) + h >= limit:
+                    continue
+                if new_dist < dist.get(nei, inf):
+                    dist[nei] = new_dist
+                    parent[nei] = node
+                    heappush(heap, (new_dist + h, new_dist, nei))
+        return None
+
+    # (distance, path) to the closest of the targets (a set of names), (None, None) if none is within the limitation
+        # the same result as Dijkstra with an is_target test, but only a set lookup per settled node
+    def find_nearest(self, start, targets, limit = None):
+        found = self.find_k_nearest(start, targets, 1, limit)
+        return found[0] if found else (None, None)
+
+    # [(distance, path), ...] to the k closest of the targets (a set of names) within the limitation, closest first
+        # one search from start, which stops as soon as the k-th target is settled
+    def find_k_nearest(self, start, targets, k, limit = None):
+        if limit is None:
+            limit = self.weight_limitation
+        if (start_id := self.names.get_id(start)) is None:
+            return [(0, [start])] if start in targets else []
+        target_ids = {node for name in targets if (node := self.names.get_id(name)) is not None}
+        parent = {start_id: Search_Space.NO_PARENT}
+        found = []
+        if k <= 0 or not target_ids:
+            return found
+        for node, dist in self._bounded_search(start_id, limit, parent):
+            if node in target_ids:
+                found.append((dist, self.names.to_names(self._tree_path(parent, node))))
+                if len(found) == k:
+                    break
+        return found
+
     # for testing # (Use this with find_min_path to verify the minimum weight path.)
         # if exceed limitation would return inf
     # find_type 
         # : None - specific person's name
         # : "" - include specific info in find_type
-    def Dijkstra(self, start, target, find_info = None, get_info = None):
-        def back_track_path(target_node):
-            path = []
-            current = target_node
-            while current != start:
-                path.append(current)
-                current = prev_node[current]
-            path.append(start)
-            path.reverse()
-            return path
-        
-        min_path = defaultdict(lambda : self.weight_limitation)
-        min_path[start] = 0
-        prev_node = {}
-        heap = [(0, start)]
+    @_with_space
+    def Dijkstra(self, space, start, target, find_info = None, get_info = None, limit = None):
+        get_name = self.names.get_name
+        def is_target(node_name):
+            if find_info == None :
+                return node_name == target
+            if (persona := get_info(node_name)) != None :
+                if (search_info := persona.get(find_info)) != None :
+                    return target in search_info
+            return False
+
+        if (start_id := self.names.get_id(start)) is None:
+            # unknown person has no friends, only the start itself can be reached
+            return (0, [start]) if is_target(start) else (None, None)
+
+        if limit is None:
+            limit = self.weight_limitation
+        neighbors = self.store.neighbors
+        gen = space.new_query(self.store.node_cnt())
+        stamp, min_path, prev_node = space.stamp[0], space.dist[0], space.parent[0]
+        stamp[start_id] = gen
+        min_path[start_id] = 0
+        prev_node[start_id] = Search_Space.NO_PARENT
+        heap = space.heap
+        heap.append((0, start_id))
         while heap:
             now_path, now_node = heappop(heap)
             if now_path > min_path[now_node] :
                 continue
-            if find_info == None :
-                if now_node == target:
-                    return (now_path, back_track_path(now_node))
-            else :
-                if (persona := get_info(now_node)) != None :
-                    if (search_info := persona.get(find_info)) != None :
-                        if target in search_info:
-                            return (now_path, back_track_path(now_node))
-            # min_path[now_node] = now_path # no needed
-            for nei_node, nei_w in self.adj_matrix[now_node].items() :
-                if (new_path := now_path + nei_w) < min_path[nei_node] :
+            if is_target(get_name(now_node)):
+                return (now_path, self.names.to_names(space.path_to(0, now_node)))
+            for nei_node, nei_w in neighbors(now_node) :
+                # unseen node counts as the limitation, so paths exceeding it are never pushed
+                if (new_path := now_path + nei_w) < (min_path[nei_node] if stamp[nei_node] == gen else limit) :
+                    stamp[nei_node] = gen
                     min_path[nei_node] = new_path
                     prev_node[nei_node] = now_node
                     heappush(heap, (new_path, nei_node))
         return (None, None)
 
+# Contraction Hierarchies, built from the compacted arrays of CSR_Graph.export_arrays()
+    # nodes are contracted from the least important one, and shortcuts keep the distances between the remaining nodes
+    # a query only relaxes edges towards more important nodes ("upward"), from both ends
+    # nodes with too many remaining friends, or whose contraction would add many shortcuts, are not contracted
+        # they stay in a "core" where every edge counts as upward and the query runs a plain bidirectional Dijkstra
+        # (social graphs have hubs, contracting them would add shortcuts between every pair of their friends)
+    # the index is immutable, so it has to be rebuilt after the graph changes (self.version tells which graph it was built from)
+class Contraction_Hierarchy:
+    WITNESS_SETTLE_LIMIT = 64 # a witness search gives up after settling this many nodes (only adds extra shortcuts)
+    WITNESS_HOP_LIMIT = 4
+    CORE_DEGREE = 32
+    CORE_EDGE_DIFF = 2 # nodes whose contraction would add more edges than this also stay in the core
+    NO_MID = -1 # original edge, not a shortcut
+
+    def __init__(self, offsets, nbrs, wts, version = 0):
+        self.version = version
+        self.node_cnt = len(offsets) - 1
+        self.rank = array("i", [0]) * self.node_cnt
+        self._build(offsets, nbrs, wts)
+
+    def _build(self, offsets, nbrs, wts):
+        node_cnt = self.node_cnt
+        # remaining graph: adj[u][v] = (weight, middle node of the shortcut)
+        adj = [{} for _ in range(node_cnt)]
+        for u in range(node_cnt):
+            adj_u = adj[u]
+            for i in range(offsets[u], offsets[u + 1]):
+                adj_u[nbrs[i]] = (wts[i], self.NO_MID)
+        contracted_nei = [0] * node_cnt
+        up = [None] * node_cnt # upward edges of each contracted node: [(nei, weight, mid), ...]
+
+        def priority(v):
+            if len(adj[v]) > self.CORE_DEGREE:
+                return inf
+            if (edge_diff := len(self._shortcuts(adj, v)) - len(adj[v])) > self.CORE_EDGE_DIFF:
+                return inf
+            return edge_diff + contracted_nei[v]
+
+        heap = [(priority(v), v) for v in range(node_cnt)]
+        heap.sort()
+        order = 0
+        while heap:
+            prio, v = heappop(heap)
+            if prio == inf:
+                # every remaining node belongs to the core
+                heappush(heap, (prio, v))
+                break
+            # lazy update: the priority may be outdated by the contraction of neighbors
+            new_prio = priority(v)
+            if new_prio == inf or (heap and new_prio > heap[0][0]):
+                heappush(heap, (new_prio, v))
+                continue
+            self.rank[v] = order
+            order += 1
+            up[v] = [(nei, w, mid) for nei, (w, mid) in adj[v].items()]
+            for u, x, w in self._shortcuts(adj, v):
+                if w < adj[u].get(x, (inf,))[0]:
+                    adj[u][x] = adj[x][u] = (w, v)
+            for nei in adj[v]:
+                del adj[nei][v]
+                contracted_nei[nei] += 1
+            adj[v] = None
+        self.core_cnt = len(heap)
+        for _, v in heap:
+            self.rank[v] = order
+            order += 1
+            up[v] = [(nei, w, mid) for nei, (w, mid) in adj[v].items()]
+
+        # upward graph as CSR arrays
+        self.up_offsets = array("q", [0])
+        self.up_nbrs = array(CSR_Graph.ID_CODE)
+        self.up_wts = array(wts.typecode)
+        self.up_mids = array(CSR_Graph.ID_CODE)
+        for v in range(node_cnt):
+            for nei, w, mid in up[v]:
+                self.up_nbrs.append(nei)
+                self.up_wts.append(w)
+                self.up_mids.append(mid)
+            self.up_offsets.append(len(self.up_nbrs))
+
+    # shortcuts (u, x, weight) needed if v is contracted now
+    def _shortcuts(self, adj, v):
+        shortcuts = []
+        neis = list(adj[v].items())
+        for i, (u, (w_uv, _)) in enumerate(neis):
+            targets = {x: w_uv + w_vx for x, (w_vx, _) in neis[i + 1:]}
+            if not targets:
+                continue
+            witness = self._witness_search(adj, u, v, targets)
+            for x, w in targets.items():
+                if witness.get(x, inf) > w:
+                    shortcuts.append((u, x, w))
+        return shortcuts
+
+    # bounded Dijkstra from u in the remaining graph avoiding v, until every target is settled
+    def _witness_search(self, adj, u, v, targets):
+        max_dist = max(targets.values())
+        remaining = len(targets)
+        dist = {u: 0}
+        heap = [(0, u, 0)]
+        settled = 0
+        while heap and settled < self.WITNESS_SETTLE_LIMIT:
+            d, node, hops = heappop(heap)
+            if d > dist[node]:
+                continue
+            settled += 1
+            if node in targets:
+                remaining -= 1
+                if remaining == 0:
+                    break
+            if hops == self.WITNESS_HOP_LIMIT:
+                continue
+            for nei, (w, _) in adj[node].items():
+                if nei == v or (new_d := d + w) > max_dist:
+                    continue
+                if new_d < dist.get(nei, inf):
+                    dist[nei] = new_d
+                    heappush(heap, (new_d, nei, hops + 1))
+        return dist
+
+    def upward(self, u):
+        s, e = self.up_offsets[u], self.up_offsets[u + 1]
+        return zip(self.up_nbrs[s:e], self.up_wts[s:e], self.up_mids[s:e])
+
+    def is_core(self, u):
+        return self.rank[u] >= self.node_cnt - self.core_cnt
+
+    # return (min distance, path ids), or (None, []) if there is no path shorter than limit
+    def find_min_path(self, start, target, limit = inf):
+        if start == target:
+            return (0, [start])
+        if max(start, target) >= self.node_cnt:
+            return (None, [])
+        dists = [{start: 0}, {target: 0}]
+        parents = [{start: None}, {target: None}]
+        # 1. upward searches in the contracted part, core nodes are reached but not expanded
+        for direct in (0, 1):
+            self._upward_search(dists[direct], parents[direct], limit)
+        min_dist, meet = limit, None
+        for node, dist in dists[0].items():
+            if (other_dist := dists[1].get(node)) is not None and dist + other_dist < min_dist:
+                min_dist, meet = dist + other_dist, node
+        # 2. bidirectional Dijkstra inside the core, starting from the core nodes reached by both searches
+        heaps = [[(d, node) for node, d in dists[direct].items() if self.is_core(node)] for direct in (0, 1)]
+        for heap in heaps:
+            heap.sort()
+        while heaps[0] or heaps[1]:
+            if heaps[0] and heaps[1]:
+                if heaps[0][0][0] + heaps[1][0][0] >= min_dist:
+                    break
+                direct = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            else:
+                # the other direction is finished, its labels can still be met
+                direct = 0 if heaps[0] else 1
+                if heaps[direct][0][0] >= min_dist:
+                    break
+            now_dist, node = heappop(heaps[direct])
+            dist, other = dists[direct], dists[1 - direct]
+            if now_dist > dist[node]:
+                continue
+            for nei, w, mid in self.upward(node):
+                if (new_dist := now_dist + w) < min_dist and new_dist < dist.get(nei, inf):
+                    dist[nei] = new_dist
+                    parents[direct][nei] = (node, mid)
+                    heappush(heaps[direct], (new_dist, nei))
+                    if (other_dist := other.get(nei)) is not None and new_dist + other_dist < min_dist:
+                        min_dist, meet = new_dist + other_dist, nei
+        if meet is None:
+            return (None, [])
+        forward = self._unpack_tree(parents[0], meet)
+        backward = self._unpack_tree(parents[1], meet)
+        return (min_dist, forward + backward[-2::-1])
+
+    def _upward_search(self, dist, parent, limit):
+        heap = [(0, root) for root in dist]
+        while heap:
+            now_dist, node = heappop(heap)
+            if now_dist > dist[node] or self.is_core(node):
+                continue
+            for nei, w, mid in self.upward(node):
+                if (new_dist := now_dist + w) < limit and new_dist < dist.get(nei, inf):
+                    dist[nei] = new_dist
+                    parent[nei] = (node, mid)
+                    heappush(heap, (new_dist, nei))
+
+    # path from the root of a search tree to node, with every shortcut expanded
+    def _unpack_tree(self, parent, node):
+        path = [node]
+        while (edge := parent[node]) is not None:
+            prev, mid = edge
+            path.extend(self._unpack_edge(node, prev, mid)[1:])
+            node = prev
+        path.reverse()
+        return path
+
+    # nodes from a to b (inclusive) of the edge a - b
+    def _unpack_edge(self, a, b, mid):
+        path = [a]
+        stack = [(a, b, mid)]
+        while stack:
+            a, b, mid = stack.pop()
+            if mid == self.NO_MID:
+                path.append(b)
+                continue
+            # both halves of a shortcut are upward edges of its middle node
+            stack.append((mid, b, self._edge_mid(mid, b)))
+            stack.append((a, mid, self._edge_mid(mid, a)))
+        return path
+
+    def _edge_mid(self, low, high):
+        for nei, _, mid in self.upward(low):
+            if nei == high:
+                return mid
+        raise KeyError((low, high))
+
+# landmark distance tables for the ALT (A*, landmarks, triangle inequality) search
+    # every connected component gets its own landmarks, the k-th landmarks of all components share table k
+    # so table[k][u] is the distance from the k-th landmark of u's component (-1 if the component has less landmarks)
+    # the first landmark of a component is its union-find root (find_root(node id) -> node id),
+    # the others are picked one by one as the node farthest from the landmarks already picked
+class Landmarks:
+    LANDMARK_CNT = 8
+    ACTIVE_CNT = 4 # landmarks used by one query, the ones giving the best bound between start and target
+
+    def __init__(self, offsets, nbrs, wts, version = 0, find_root = None):
+        self.version = version
+        self.node_cnt = len(offsets) - 1
+        self.offsets, self.nbrs, self.wts = offsets, nbrs, wts
+        dist_code = "d" if wts.typecode in "fd" else "q"
+        self.component = array("i", [-1]) * self.node_cnt
+        self.tables = [array(dist_code, [-1]) * self.node_cnt for _ in range(self.LANDMARK_CNT)]
+        self.landmarks = [] # landmark ids of each component
+        for u in range(self.node_cnt):
+            if self.component[u] == -1 and offsets[u + 1] > offsets[u]:
+                self._add_component(u, find_root)
+        del self.offsets, self.nbrs, self.wts
+
+    def _add_component(self, u, find_root):
+        comp = len(self.landmarks)
+        root = find_root(u) if find_root is not None else None
+        if root is None or not 0 <= root < self.node_cnt or self.component[root] != -1:
+            root = u
+        members = self._sssp(root, self.tables[0])
+        if self.tables[0][u] == -1: # root is not in u's component any more (the union-find is newer than this graph)
+            for v in members:
+                self.tables[0][v] = -1
+            root = u
+            members = self._sssp(root, self.tables[0])
+        landmarks = [root]
+        for v in members:
+            self.component[v] = comp
+        # farthest point selection
+        closest = {v: self.tables[0][v] for v in members}
+        while len(landmarks) < min(self.LANDMARK_CNT, len(members)):
+            far = max(closest, key=closest.get)
+            if closest[far] == 0:
+                break
+            table = self.tables[len(landmarks)]
+            self._sssp(far, table)
+            landmarks.append(far)
+            for v in members:
+                if table[v] < closest[v]:
+                    closest[v] = table[v]
+        self.landmarks.append(landmarks)
+
+    # full Dijkstra from source into table, return the reached nodes
+    def _sssp(self, source, table):
+        offsets, nbrs, wts = self.offsets, self.nbrs, self.wts
+        table[source] = 0
+        members = []
+        heap = [(0, source)]
+        while heap:
+            d, u = heappop(heap)
+            if d > table[u]:
+                continue
+            members.append(u)
+            for i in range(offsets[u], offsets[u + 1]):
+                v, nd = nbrs[i], d + wts[i]
+                if table[v] == -1 or nd < table[v]:
+                    table[v] = nd
+                    heappush(heap, (nd, v))
+        return members
+
+    def same_component(self, u, v):
+        return u < self.node_cnt and v < self.node_cnt and self.component[u] == self.component[v] != -1
+
+    # [(table, distance from landmark to start, distance from landmark to target), ...]
+    def active(self, start, target):
+        comp = self.component[start]
+        tables = self.tables[:len(self.landmarks[comp])]
+        active = sorted(((tab, tab[start], tab[target]) for tab in tables), key=lambda a: -abs(a[1] - a[2]))
+        return active[:self.ACTIVE_CNT]
+
+    # lower bound of the distance from v to the target (side 0) or to the start (side 1)
+    def bound(self, active, side, v):
+        best = 0
+        for tab, to_start, to_target in active:
+            d = tab[v] - (to_start if side else to_target)
+            if d < 0:
+                d = -d
+            if d > best:
+                best = d
+        return best
+
+# hub labels (2-hop cover) built by pruned landmark labeling
+    # every node u gets a label [(hub, distance from u to hub), ...] sorted by hub rank,
+    # so the distance between s and t is the minimum of dist(s, hub) + dist(t, hub) over their common hubs
+    # hubs are processed from the node with most friends, and a pruned Dijkstra from each hub
+    # only labels nodes whose distance is not covered by the labels added before
+    # every label entry also keeps the next node towards its hub, so the path can be unpacked without searching
+class Hub_Labels:
+    def __init__(self, offsets, nbrs, wts, version = 0, _arrays = None):
+        self.version = version
+        self.node_cnt = len(offsets) - 1
+        if _arrays is not None: # loaded from a file
+            self.order, self.label_offsets, self.hubs, self.dists, self.parents = _arrays
+            return
+        self.order = array(CSR_Graph.ID_CODE, sorted(range(self.node_cnt), key=lambda u: offsets[u] - offsets[u + 1]))
+        self._build(offsets, nbrs, wts)
+
+    def _build(self, offsets, nbrs, wts):
+        hubs = [[] for _ in range(self.node_cnt)]
+        dists = [[] for _ in range(self.node_cnt)]
+        parents = [[] for _ in range(self.node_cnt)]
+        hub_dist = [inf] * self.node_cnt # distances from the current hub to the hubs of its label, by hub rank
+        for rank, hub in enumerate(self.order):
+            if offsets[hub + 1] == offsets[hub]:
+                break # nodes without friends come last
+            for h, d in zip(hubs[hub], dists[hub]):
+                hub_dist[h] = d
+            dist = {hub: 0}
+            parent = {hub: Search_Space.NO_PARENT}
+            heap = [(0, hub)]
+            while heap:
+                d, u = heappop(heap)
+                if d > dist[u]:
+                    continue
+                # prune: the labels added so far already give a path this short
+                if any(hub_dist[h] + u_dist <= d for h, u_dist in zip(hubs[u], dists[u])):
+                    continue
+                hubs[u].append(rank)
+                dists[u].append(d)
+                parents[u].append(parent[u])
+                for i in range(offsets[u], offsets[u + 1]):
+                    v, nd = nbrs[i], d + wts[i]
+                    if nd < dist.get(v, inf):
+                        dist[v] = nd
+                        parent[v] = u
+                        heappush(heap, (nd, v))
+            for h in hubs[hub]:
+                hub_dist[h] = inf
+
+        self.label_offsets = array("q", [0])
+        self.hubs = array(CSR_Graph.ID_CODE)
+        self.dists = array(wts.typecode)
+        self.parents = array(CSR_Graph.ID_CODE)
+        for u in range(self.node_cnt):
+            self.hubs.extend(hubs[u])
+            self.dists.extend(dists[u])
+            self.parents.extend(parents[u])
+            self.label_offsets.append(len(self.hubs))
+
+    def label_size(self):
+        return len(self.hubs)
+
+    # return (distance, hub rank) of the best common hub, or (inf, None)
+    def _distance(self, s, t):
+        hubs, dists = self.hubs, self.dists
+        i, i_end = self.label_offsets[s], self.label_offsets[s + 1]
+        j, j_end = self.label_offsets[t], self.label_offsets[t + 1]
+        best, best_hub = inf, None
+        while i < i_end and j < j_end:
+            hub_s, hub_t = hubs[i], hubs[j]
+            if hub_s == hub_t:
+                if (d := dists[i] + dists[j]) < best:
+                    best, best_hub = d, hub_s
+                i += 1
+                j += 1
+            elif hub_s < hub_t:
+                i += 1
+            else:
+                j += 1
+        return best, best_hub
+
+    # return (min distance, path ids), or (None, []) if there is no path shorter than limit
+    def find_min_path(self, start, target, limit = inf):
+        if start == target:
+            return (0, [start])
+        if max(start, target) >= self.node_cnt:
+            return (None, [])
+        dist, hub_rank = self._distance(start, target)
+        if dist >= limit:
+            return (None, [])
+        return (dist, self._path_to_hub(start, hub_rank) + self._path_to_hub(target, hub_rank)[-2::-1])
+
+    # node ids from u to the hub, following the parents stored in the labels
+    def _path_to_hub(self, u, hub_rank):
+        hub = self.order[hub_rank]
+        path = [u]
+        while u != hub:
+            i = bisect_left(self.hubs, hub_rank, self.label_offsets[u], self.label_offsets[u + 1])
+            u = self.parents[i]
+            path.append(u)
+        return path
+
+    def save(self, path, fingerprint):
+        arrays = (self.order, self.label_offsets, self.hubs, self.dists, self.parents)
+        header = {"fingerprint": fingerprint, "node_cnt": self.node_cnt,
+                  "arrays": [[arr.typecode, len(arr)] for arr in arrays]}
+        tmp_path = str(path) + ".tmp"
+        with open(tmp_path, "wb") as fw:
+            fw.write(json.dumps(header).encode() + b"\n")
+            for arr in arrays:
+                arr.tofile(fw)
+        os.replace(tmp_path, path)
+
+    # return None if the file is missing, broken or was built from another graph
+    @classmethod
+    def load(cls, path, fingerprint, version = 0):
+        try:
+            with open(path, "rb") as fr:
+                header = json.loads(fr.readline())
+                if header.get("fingerprint") != fingerprint:
+                    return None
+                arrays = []
+                for typecode, length in header["arrays"]:
+                    arr = array(typecode)
+                    arr.fromfile(fr, length)
+                    arrays.append(arr)
+        except (OSError, ValueError, EOFError, KeyError):
+            return None
+        return cls([0] * (header["node_cnt"] + 1), None, None, version, _arrays = arrays)
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
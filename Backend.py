@@ -1,14 +1,477 @@
+import hashlib
 import json
+import queue
+import random
+import threading
+from collections import Counter, OrderedDict, deque
+from itertools import chain, islice
 from pathlib import Path
 
 from Algorithm import *
-from persona_data import PERSONAS, get_persona
+from persona_data import find_personas, persona_names
+
+# cross-checks find_min_path with a plain Dijkstra on a background thread
+    # mode: "off" - never, "sampled" - sample_percent % of the queries, "always" - every query
+    # the check runs on the snapshot the query used, so later changes of the relations never affect it
+class Path_Verifier:
+    MODES = ("off", "sampled", "always")
+
+    def __init__(self, mode = "sampled", sample_percent = 1, max_pending = 1000):
+        self.set_mode(mode, sample_percent)
+        self.pending = queue.Queue(maxsize = max_pending)
+        self.worker = None
+        self.checked_cnt = 0
+        self.dropped_cnt = 0 # queue was full
+        self.mismatches = deque(maxlen = 100)
+
+    def set_mode(self, mode, sample_percent = None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown verification mode: {mode}")
+        if sample_percent is not None and not 0 <= sample_percent <= 100:
+            raise ValueError("sample_percent must be between 0 and 100")
+        self.mode = mode
+        if sample_percent is not None:
+            self.sample_percent = sample_percent
+
+    def should_check(self):
+        if self.mode == "always":
+            return True
+        return self.mode == "sampled" and random.random() * 100 < self.sample_percent
+
+    # queue the check, it never blocks or fails the request
+        # graph: the snapshot (Backend.snapshot) result was computed on
+    def submit(self, fri1, fri2, result, limit, graph):
+        if not self.should_check():
+            return
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run, name="path-verifier", daemon=True)
+            self.worker.start()
+        try:
+            self.pending.put_nowait((fri1, fri2, result, graph, limit))
+        except queue.Full:
+            self.dropped_cnt += 1
+
+    # block until every queued check is done (for tests)
+    def join(self):
+        self.pending.join()
+
+    def _run(self):
+        while True:
+            job = self.pending.get()
+            try:
+                self._check(*job)
+            except Exception as exc:
+                print(f"[verify] check failed: {exc}")
+            finally:
+                self.pending.task_done()
+
+    def _check(self, fri1, fri2, result, graph, limit):
+        version = graph.version
+        check = graph.Dijkstra(fri1, fri2, limit=limit)
+        self.checked_cnt += 1
+        if result[0] != check[0]:
+            self.mismatches.append((fri1, fri2, version, result, check))
+            print(f"[verify] mismatch {fri1} -> {fri2} at graph version {version} (limit {limit}): "
+                  f"find_min_path={result} Dijkstra={check}")
+
+# a derived index of the graph (e.g. Contraction_Hierarchy), rebuilt on a background thread after the graph changes
+    # build(offsets, nbrs, wts, version) gets a compacted copy of the last published graph (snapshot() -> (graph, uf)),
+        # so writers never wait for the export
+    # readers only get the index if it was built from the current graph version
+    # enabled: off - never built, max_nodes: graphs with more nodes are not indexed,
+    # delay: seconds without a new request before a build starts, so a burst of changes causes one build
+class Background_Index:
+    def __init__(self, name, snapshot, build, enabled = True, max_nodes = None, delay = 0):
+        self.name = name
+        self.snapshot = snapshot
+        self.build = build
+        self.enabled = enabled
+        self.max_nodes = max_nodes
+        self.delay = delay
+        self.index = None
+        self.cond = threading.Condition()
+        self.requested = False
+        self.building = False
+        self.worker = None
+        self.build_cnt = 0
+        self.skipped_cnt = 0 # requests for a graph above max_nodes
+
+    # turning the index off drops it, turning it on asks for a build
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            self.schedule()
+        else:
+            self.index = None
+
+    # ask for a rebuild, several requests while a build is running only cause one more build
+    def schedule(self):
+        graph = self.snapshot()[0]
+        if not self.enabled or self.get(graph.version) is not None:
+            return
+        if self.max_nodes is not None and (node_cnt := graph.store.node_cnt()) > self.max_nodes:
+            if self.skipped_cnt == 0:
+                print(f"[{self.name}] not built, the graph has {node_cnt} people (max {self.max_nodes})")
+            self.skipped_cnt += 1
+            return
+        with self.cond:
+            self.requested = True
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, name=f"{self.name}-builder", daemon=True)
+                self.worker.start()
+            self.cond.notify_all()
+
+    def get(self, version):
+        index = self.index
+        if index is not None and index.version == version:
+            return index
+        return None
+
+    # the caller knows the index built for old_version is still valid for new_version, so no rebuild is needed
+    def carry_over(self, old_version, new_version):
+        if (index := self.get(old_version)) is not None:
+            index.version = new_version
+
+    # block until there is no pending rebuild (for tests)
+    def join(self):
+        with self.cond:
+            while self.requested or self.building:
+                self.cond.wait()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.requested:
+                    self.cond.wait()
+                self.requested = False
+                self.building = True
+                # debounce: wait until no new request came for delay seconds
+                while self.delay and self.cond.wait_for(lambda : self.requested, self.delay):
+                    self.requested = False
+            try:
+                if not self.enabled:
+                    continue
+                graph = self.snapshot()[0]
+                self.index = self.build(*graph.store.export_arrays(), graph.version)
+                self.build_cnt += 1
+            except Exception as exc:
+                print(f"[{self.name}] rebuild failed: {exc}")
+            finally:
+                with self.cond:
+                    self.building = False
+                    self.cond.notify_all()
+
+# LRU cache of get_best_path results keyed by (fri1, fri2, weight_limitation)
+    # pairs are stored in one direction only, the path is reversed for the other one
+    # a result is only stored if the graph did not change while it was computed (current_version())
+class Path_Cache:
+    def __init__(self, current_version, max_entries = 10000):
+        self.current_version = current_version
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # (fri1, fri2, limit) -> (path_len, path tuple or [])
+        self.lock = threading.Lock()
+        self.hit_cnt = 0
+        self.miss_cnt = 0
+        self.eviction_cnt = 0
+        self.invalidation_cnt = 0
+
+    def _key(self, fri1, fri2, limit):
+        if fri2 < fri1:
+            return (fri2, fri1, limit), True
+        return (fri1, fri2, limit), False
+
+    # return the cached result or None
+    def get(self, fri1, fri2, limit):
+        key, reverse = self._key(fri1, fri2, limit)
+        with self.lock:
+            if (value := self.entries.get(key)) is None:
+                self.miss_cnt += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hit_cnt += 1
+        dist, path = value
+        path = list(path)
+        return (dist, path[::-1] if reverse else path)
+
+    def put(self, fri1, fri2, limit, result, version):
+        key, reverse = self._key(fri1, fri2, limit)
+        dist, path = result
+        path = tuple(path[::-1] if reverse else path)
+        with self.lock:
+            if version != self.current_version():
+                return
+            self.entries[key] = (dist, path)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.eviction_cnt += 1
+
+    # drop every entry for which drop(key, value) is true
+    def invalidate(self, drop):
+        with self.lock:
+            for key in [key for key, value in self.entries.items() if drop(key, value)]:
+                del self.entries[key]
+                self.invalidation_cnt += 1
+
+    def clear(self):
+        with self.lock:
+            self.invalidation_cnt += len(self.entries)
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hit_cnt,
+            'misses': self.miss_cnt,
+            'evictions': self.eviction_cnt,
+            'invalidations': self.invalidation_cnt
+        }
+
+# bounded shortest path tree of one source, every node closer than the limitation
+    # order: node ids from the source, in the order a Dijkstra settles them (so also in the order of find_target)
+class Source_Tree:
+    def __init__(self, graph, source, limit):
+        self.version = graph.version
+        self.parent = {source: Search_Space.NO_PARENT}
+        self.dist = {}
+        self.order = []
+        for node, dist in graph._bounded_search(source, limit, self.parent):
+            self.dist[node] = dist
+            self.order.append(node)
+
+    def __len__(self):
+        return len(self.order)
+
+    def path_to(self, node):
+        path = []
+        while node != Search_Space.NO_PARENT:
+            path.append(node)
+            node = self.parent[node]
+        path.reverse()
+        return path
+
+# LFU cache of Source_Tree of the most queried starting people, keyed by (source, limit)
+    # queries count the uses of their source, once a source has min_uses it gets a tree,
+    # as long as the trees fit in max_nodes nodes after evicting the ones of less used sources
+    # the size of a tree which did not fit is remembered, it is only asked for again once enough less used trees
+    # could make room for it (a tree bigger than max_nodes never is)
+    # trees are built on a background thread from the current snapshot, and only used while they match the graph version,
+    # refresh() rebuilds every cached tree after the relations changed
+class Source_Tree_Cache:
+    def __init__(self, snapshot, max_nodes = 200000, min_uses = 3, max_tracked = 10000):
+        self.snapshot = snapshot
+        self.max_nodes = max_nodes
+        self.min_uses = min_uses
+        self.max_tracked = max_tracked
+        self.trees = {} # (source, limit) -> Source_Tree
+        self.uses = Counter() # (source, limit) -> queries, halved when more than max_tracked sources are counted
+        self.node_cnt = 0
+        self.rejected = {} # (source, limit) -> nodes of its tree, which did not fit
+        self.cond = threading.Condition()
+        self.wanted = set() # keys waiting for a tree
+        self.stale = False # the cached trees need a rebuild
+        self.building = False
+        self.worker = None
+        self.hit_cnt = 0
+        self.miss_cnt = 0
+        self.build_cnt = 0
+        self.eviction_cnt = 0
+
+    # count one query from source, and ask for its tree when it became hot enough
+    def use(self, source, limit):
+        key = (source, limit)
+        with self.cond:
+            self.uses[key] += 1
+            if len(self.uses) > self.max_tracked:
+                self.uses = Counter({key: cnt // 2 for key, cnt in self.uses.items() if cnt > 1 or key in self.trees})
+                self.rejected = {key: size for key, size in self.rejected.items()
+                                 if key in self.uses or size > self.max_nodes}
+            if key in self.trees or key in self.wanted or self.uses[key] < self.min_uses:
+                return
+            if self._room_for(key) < self.rejected.get(key, 1):
+                return
+            self.wanted.add(key)
+            self._wake()
+
+    # nodes free for the tree of key after evicting the trees of less used sources (holding self.cond)
+    def _room_for(self, key):
+        uses = self.uses[key]
+        colder = sum(len(tree) for cached, tree in self.trees.items() if self.uses[cached] < uses)
+        return self.max_nodes - self.node_cnt + colder
+
+    # the tree of source if it matches the graph version, otherwise None
+    def get(self, source, limit, version):
+        tree = self.trees.get((source, limit))
+        if tree is None or tree.version != version:
+            self.miss_cnt += 1
+            return None
+        self.hit_cnt += 1
+        return tree
+
+    # get_best_path from a tree of either end, None if neither has an up to date tree
+        # the two people have to be connected (checked by the caller)
+    def find_min_path(self, fri1, fri2, limit, graph):
+        self.use(fri1, limit)
+        names = graph.names
+        for source, target, reverse in ((fri1, fri2, False), (fri2, fri1, True)):
+            if (tree := self.trees.get((source, limit))) is None or tree.version != graph.version:
+                continue
+            self.hit_cnt += 1
+            if (node := names.get_id(target)) not in tree.dist:
+                return (None, [])
+            path = names.to_names(tree.path_to(node))
+            return (tree.dist[node], path[::-1] if reverse else path)
+        self.miss_cnt += 1
+        return None
+
+    # [(distance, path), ...] to the k closest people passing is_target(name) from the tree of start,
+        # None if it has no up to date tree
+    def find_targets(self, start, is_target, k, limit, graph):
+        self.use(start, limit)
+        if (tree := self.get(start, limit, graph.version)) is None:
+            return None
+        names = graph.names
+        found = []
+        for node in tree.order:
+            if len(found) == k:
+                break
+            if is_target(names.get_name(node)):
+                found.append((tree.dist[node], names.to_names(tree.path_to(node))))
+        return found
+
+    def refresh(self):
+        with self.cond:
+            if self.trees:
+                self.stale = True
+                self._wake()
+
+    def _wake(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run, name="source-tree-builder", daemon=True)
+            self.worker.start()
+        self.cond.notify_all()
+
+    # block until every wanted tree is built (for tests)
+    def join(self):
+        with self.cond:
+            while self.wanted or self.stale or self.building:
+                self.cond.wait()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.wanted and not self.stale:
+                    self.cond.wait()
+                keys = self.wanted | set(self.trees) if self.stale else set(self.wanted)
+                self.wanted.clear()
+                self.stale = False
+                self.building = True
+            try:
+                graph = self.snapshot()[0]
+                for key in sorted(keys, key=lambda key: -self.uses[key]):
+                    source, limit = key
+                    if (node := graph.names.get_id(source)) is None:
+                        continue
+                    self._store(key, Source_Tree(graph, node, limit))
+            except Exception as exc:
+                print(f"[source-tree] build failed: {exc}")
+            finally:
+                with self.cond:
+                    self.building = False
+                    self.cond.notify_all()
+
+    # add the tree after evicting the trees of less used sources, or remember its size if even that leaves no room
+    def _store(self, key, tree):
+        with self.cond:
+            if (old := self.trees.pop(key, None)) is not None:
+                self.node_cnt -= len(old)
+            self.build_cnt += 1
+            if self._room_for(key) < len(tree):
+                self.rejected[key] = len(tree)
+                return
+            self.rejected.pop(key, None)
+            while self.node_cnt + len(tree) > self.max_nodes:
+                coldest = min(self.trees, key=lambda cached: self.uses[cached])
+                self.node_cnt -= len(self.trees.pop(coldest))
+                self.eviction_cnt += 1
+            self.trees[key] = tree
+            self.node_cnt += len(tree)
+
+    def stats(self):
+        return {
+            'trees': len(self.trees),
+            'nodes': self.node_cnt,
+            'max_nodes': self.max_nodes,
+            'hits': self.hit_cnt,
+            'misses': self.miss_cnt,
+            'builds': self.build_cnt,
+            'evictions': self.eviction_cnt,
+            'rejected': len(self.rejected)
+        }
+
+# iterate (fri1, fri2, score) of a friendship data file (.json or the legacy text format)
+def read_relations(data_path):
+    if data_path.suffix.lower() == ".json":
+        print("read relation from json file")
+        yield from _read_json_relations(data_path)
+    else:
+        yield from _read_legacy_relations(data_path)
+
+def _read_json_relations(data_path):
+    with data_path.open("r", encoding="utf-8") as fr:
+        data = json.load(fr)
+    relations = data.get("relations", [])
+    for info in relations:
+        if len(info) != 3:
+            continue
+        fri1, fri2, score = info
+        yield fri1, fri2, int(score)
+
+def _read_legacy_relations(data_path):
+    with data_path.open("r", encoding="utf-8") as fr:
+        while True:
+            input_line = fr.readline()
+            if input_line == "-\n":
+                continue
+            if input_line == "\n" or input_line == "":
+                break
+
+            fri1, fri2, score = input_line.split(", ")
+            score = int(score[:-1])
+            yield fri1, fri2, score
 
 class Backend:
+    # hub labels are built in pure Python, their size and build time grow too fast for bigger graphs
+    HUB_LABEL_MAX_NODES = 2000
+    LANDMARK_MAX_NODES = 100000 # one full search per landmark on every build
+    INDEX_DELAY = 2 # seconds without changes before the indexes are rebuilt
+
     def init_space(self):
-        self.uf = UF_by_size()
         self.graph = Bidirectional_Dijkstra()
-        self.get_persona = get_persona
+        self.uf = UF_by_array(self.graph.names) # shares the name ids with the graph
+        self.find_personas = find_personas # keyword -> names of the matching personas
+        self.verifier = Path_Verifier()
+        self.write_lock = threading.RLock() # held while the graph changes
+        self.ch = Background_Index("contraction-hierarchy", self.snapshot, Contraction_Hierarchy,
+                                   enabled=False, delay=self.INDEX_DELAY)
+        self.landmarks = Background_Index("landmarks", self.snapshot,
+                                          lambda *arrays: Landmarks(*arrays, find_root=self._root_id),
+                                          enabled=False, max_nodes=self.LANDMARK_MAX_NODES, delay=self.INDEX_DELAY)
+        self.labels = Background_Index("hub-labels", self.snapshot, self._build_labels,
+                                       enabled=False, max_nodes=self.HUB_LABEL_MAX_NODES, delay=self.INDEX_DELAY)
+        self.labels_path = None # hub labels built from the loaded relations are saved here
+        self.loaded_version = None # graph version right after loading the data file
+        self.cache = Path_Cache(lambda : self.graph.version)
+        self.trees = Source_Tree_Cache(self.snapshot)
+        self.name_index = Prefix_Index(persona_names()) # autocomplete over the people of the graph and the personas
+        self.query_pool = None # searches run in worker processes when set (set_query_pool)
+        self._publish()
+        self.listeners = []
+        self.on_change(self._update_components)
+        self.on_change(self._update_cache)
+        self.on_change(self._update_landmarks)
+        self.on_change(self._update_name_index)
     
     def __init__(self, path):
         self.init_space()
@@ -17,38 +480,24 @@ class Backend:
         self.data_path = Path(path)
         if not self.data_path.exists():
             raise FileNotFoundError(f"Friendship data file not found: {path}")
-        if self.data_path.suffix.lower() == ".json":
-            print("read relation from json file")
-            self._load_from_json()
-        else:
-            self._load_from_legacy_text()
+        self._load()
+        self.graph.compact() # merge the loaded relations into the flat CSR arrays
+        self.name_index = Prefix_Index(chain(persona_names(), self.graph.names.names))
+        self._publish()
+        self.loaded_version = self.graph.version
+        self.labels_path = self.data_path.with_name(self.data_path.name + ".labels")
+        self._graph_changed()
         self.save_data_path = self.data_path.with_name(self.data_path.name + "_new_data")
     
     def when_exit(self):
         self._save_to_json()
+        self.set_query_pool(0)
 
-    def _load_from_json(self):
-        with self.data_path.open("r", encoding="utf-8") as fr:
-            data = json.load(fr)
-        relations = data.get("relations", [])
-        for info in relations:
-            if len(info) != 3:
-                continue
-            fri1, fri2, score = info
-            self.add_relation(fri1, fri2, int(score))
-    
-    def _load_from_legacy_text(self):
-        with self.data_path.open("r", encoding="utf-8") as fr:
-            while True:
-                input_line = fr.readline()
-                if input_line == "-\n":
-                    continue
-                if input_line == "\n" or input_line == "":
-                    break
-
-                fri1, fri2, score = input_line.split(", ")
-                score = int(score[:-1])
-                self.add_relation(fri1, fri2, score)
+    def _load(self):
+        add_edge = self.graph.add_edge
+        edges = [add_edge(fri1, fri2, score)[:2] for fri1, fri2, score in read_relations(self.data_path)]
+        # components are built in one pass after all relations are in
+        self.uf.union_many(edges)
 
     def _dump_compact_list_json(self, data): # hardcode
         key = "relations"
@@ -74,11 +523,7 @@ class Backend:
             fw.write("}\n")
 
     def _save_to_json(self):
-        relations = []
-        for fri1, fri2_info in self.graph.adj_matrix.items():
-            for fri2, score in fri2_info.items():
-                if fri1 < fri2:  # to avoid duplicates
-                    relations.append([fri1, fri2, score])
+        relations = [[fri1, fri2, score] for fri1, fri2, score in self.graph.get_all_edges()]
         data = {"relations": relations}
         
         # # normal saving method
@@ -92,64 +537,443 @@ class Backend:
     #     for fri1, fri2, score in relation :
     #         self.add_relation(fri1, fri2, score)
 
+    # run the searches of get_best_path, get_best_paths and find_target in worker processes (0 - in this process)
+    def set_query_pool(self, workers, start_method = "spawn"):
+        if self.query_pool is not None:
+            self.query_pool.close()
+            self.query_pool = None
+        if workers:
+            from Query_Pool import Query_Pool
+            self.query_pool = Query_Pool(self.graph, self.write_lock, workers, start_method)
+
+    # hub labels are off unless turned on here, the saved labels are reused if they match the loaded relations
+    def set_hub_labels(self, enabled):
+        if enabled and self.labels.index is None and self.labels_path is not None:
+            self._load_labels()
+        self.labels.set_enabled(enabled)
+
+    # the contraction hierarchy is off unless turned on here: hubs keep most of a social graph in its uncontracted core,
+        # so it is hardly faster than the bidirectional search (see Benchmark.py) and costs a full rebuild after every change
+    def set_contraction_hierarchy(self, enabled):
+        self.ch.set_enabled(enabled)
+
+    # the landmarks (ALT) are off unless turned on here: on these graphs the plain bidirectional search settles few nodes,
+        # so the heuristic costs more than it saves (ALT was about 1.5-2x slower at 50k and 200k people, see Benchmark.py)
+    def set_landmarks(self, enabled):
+        self.landmarks.set_enabled(enabled)
+
+    # mode: "off", "sampled" (sample_percent % of get_best_path calls) or "always"
+    def set_verification(self, mode, sample_percent = None):
+        self.verifier.set_mode(mode, sample_percent)
+
+    # the default limitation of the queries which do not give their own
     def set_limitation(self, limit):
         if limit == 0 :
-            self.graph.set_limitation(inf)
+            limit = inf
         self.graph.set_limitation(limit)
 
+    # limit of one query: None - the current limitation, 0 - unlimited
+    def _query_limit(self, limit, graph):
+        if limit is None:
+            return graph.weight_limitation
+        return inf if limit == 0 else limit
+
     def add_relation(self, fri1, fri2, connection_score):
-        self.uf.union(fri1, fri2)
-        self.graph.add_edge(fri1, fri2, connection_score)
+        self._change_relations([(fri1, fri2, connection_score)])
+
+    # change the score of an existing relation, return the old score (None if they are not friends)
+    def update_relation(self, fri1, fri2, new_score):
+        return self.update_relations([(fri1, fri2, new_score)])[0]
+
+    # [(fri1, fri2, new_score), ...] applied as one change, return the old scores
+        # pairs which are not friends are left out and get None
+    def update_relations(self, updates):
+        with self.write_lock:
+            get_id, weight = self.graph.names.get_id, self.graph.store.weight
+            old_scores = []
+            for fri1, fri2, _ in updates:
+                u, v = get_id(fri1), get_id(fri2)
+                old_score = None if u is None or v is None else weight(u, v)
+                old_scores.append(None if old_score == inf else old_score)
+            self._change_relations([update for update, old_score in zip(updates, old_scores) if old_score is not None])
+        return old_scores
+
+    # return False if they were not friends
+    def remove_relation(self, fri1, fri2):
+        return bool(self._change_relations([(fri1, fri2, None)]))
+
+    # remove every relation of a person, return False if the person has no friends
+    def remove_person(self, fri):
+        with self.write_lock:
+            if not self.graph.check_data(fri):
+                return False
+            graph = self.graph
+            friends = graph.names.to_names(v for v, _ in graph.store.neighbors(graph.names.get_id(fri)))
+            self._change_relations([(fri, friend, None) for friend in friends])
+        return True
+
+    # register listener(events, old_version), called while holding the write lock after the relations changed
+        # events is [(id1, id2, old score, new score), ...] with None for a missing relation
+    def on_change(self, listener):
+        self.listeners.append(listener)
+
+    # every change of the relations goes through here, [(fri1, fri2, score or None to remove), ...]
+        # return the events (changes which did nothing are left out)
+    def _change_relations(self, changes):
+        with self.write_lock:
+            graph = self.graph
+            old_version = graph.version
+            events = []
+            for fri1, fri2, score in changes:
+                if score is None:
+                    if (removed := graph.remove_edge(fri1, fri2)) is not None:
+                        u, v, old_score = removed
+                        events.append((u, v, old_score, None))
+                else:
+                    u, v, old_score = graph.add_edge(fri1, fri2, score)
+                    if old_score != score:
+                        events.append((u, v, old_score, score))
+            if events:
+                for listener in self.listeners:
+                    listener(events, old_version)
+                self._publish()
+        if events:
+            self._graph_changed()
+        return events
+
+    # union new relations, and split the sets which lost a relation if they are not connected anymore
+    def _update_components(self, events, old_version):
+        uf = self.uf
+        seeds = defaultdict(list) # set root -> ends of the removed relations
+        for u, v, old_score, new_score in events:
+            if old_score is None:
+                uf.union_id(u, v)
+        for u, v, old_score, new_score in events:
+            if new_score is None:
+                seeds[uf.find_id(u)] += (u, v)
+        # every part a set falls into holds the end of a removed relation, so searching from all of them covers the set
+        for root_seeds in seeds.values():
+            if (components := self.graph.split_seeds(root_seeds)) is not None:
+                print(f"[remove] {len(components)} parts split off a component")
+                uf.split_off(components)
+
+    # drop the cached results the changes make wrong, measured in the changed graph
+        # a result gets longer only if its path used a relation which got more expensive (or was removed)
+        # a result gets shorter only through a new or cheaper relation u - v with score w:
+        # dist(s, u) + w + dist(v, t) (or the other way round) beats it, an exceeded limitation counts as the distance to beat
+    def _update_cache(self, events, old_version):
+        if not self.cache.entries:
+            return
+        names = self.graph.names
+        longer = set()
+        shorter = []
+        for u, v, old_score, new_score in events:
+            if new_score is None or (old_score is not None and new_score > old_score):
+                fri1, fri2 = names.get_name(u), names.get_name(v)
+                longer.update(((fri1, fri2), (fri2, fri1)))
+            else:
+                shorter.append((u, v, new_score))
+        near = {}
+        if shorter:
+            entries = list(self.cache.entries.items())
+            longest = max(limit if dist is None else dist for (_, _, limit), (dist, _) in entries)
+            radius = longest - min(w for _, _, w in shorter)
+            endpoints = {node for (fri1, fri2, _), _ in entries for node in (names.get_id(fri1), names.get_id(fri2))}
+            for u, v, _ in shorter:
+                for end in (u, v):
+                    if end not in near and radius > 0:
+                        if (found := self._near_endpoints(end, radius, endpoints)) is None:
+                            self.cache.clear()
+                            return
+                        near[end] = found
+        def stale(key, value):
+            dist, path = value
+            if longer and any(pair in longer for pair in zip(path, path[1:])):
+                return True
+            if not near:
+                return False
+            s, t = names.get_id(key[0]), names.get_id(key[1])
+            to_beat = key[2] if dist is None else dist
+            for u, v, w in shorter:
+                near_u, near_v = near.get(u, {}), near.get(v, {})
+                if min(near_u.get(s, inf) + near_v.get(t, inf), near_v.get(s, inf) + near_u.get(t, inf)) + w < to_beat:
+                    return True
+            return False
+        self.cache.invalidate(stale)
+
+    # {endpoint id: distance} of the cached endpoints closer to end than radius,
+        # the search stops once every endpoint of end's component is settled,
+        # None if that takes more than CACHE_SEARCH_BUDGET nodes (flushing the cache is cheaper then)
+    CACHE_SEARCH_BUDGET = 20000
+
+    def _near_endpoints(self, end, radius, endpoints):
+        root = self.uf.find_id(end)
+        remaining = {node for node in endpoints if self.uf.find_id(node) == root}
+        found = {}
+        if not remaining:
+            return found
+        for settled, (node, dist) in enumerate(self.graph._bounded_search(end, radius), 1):
+            if node in remaining:
+                found[node] = dist
+                remaining.discard(node)
+                if not remaining:
+                    break
+            if settled >= self.CACHE_SEARCH_BUDGET:
+                return None
+        return found
+
+    # landmark distances only get too small when relations get cheaper,
+        # so after increases and removals they still are valid lower bounds for A*
+    def _update_landmarks(self, events, old_version):
+        if all(new_score is None or (old_score is not None and new_score > old_score)
+               for _, _, old_score, new_score in events):
+            self.landmarks.carry_over(old_version, self.graph.version)
 
-    def check_relation(self, fri1, fri2):
-        if self.graph.check_data(fri1) and self.graph.check_data(fri2):
-            return self.uf.check_same_union(fri1, fri2)
+    # people of new relations become suggestions (removed ones stay, they may still have a profile)
+    def _update_name_index(self, events, old_version):
+        get_name = self.graph.names.get_name
+        for u, v, old_score, _ in events:
+            if old_score is None:
+                self.name_index.add(get_name(u))
+                self.name_index.add(get_name(v))
+
+    # rebuild the derived indexes in the background
+    def _graph_changed(self):
+        self.labels.schedule()
+        self.ch.schedule()
+        self.landmarks.schedule()
+        self.trees.refresh()
+
+    # identifies the graph a saved index was built from
+    def _graph_fingerprint(self, offsets, nbrs, wts):
+        digest = hashlib.sha1()
+        for arr in (offsets, nbrs, wts):
+            digest.update(arr.typecode.encode())
+            digest.update(arr.tobytes())
+        names = self.graph.names.names[:len(offsets) - 1]
+        digest.update(json.dumps(names, ensure_ascii=False).encode())
+        return digest.hexdigest()
+
+    def _build_labels(self, offsets, nbrs, wts, version):
+        labels = Hub_Labels(offsets, nbrs, wts, version)
+        # labels of a changed graph never match the data file at the next start, so only these are saved
+        if self.labels_path is not None and version == self.loaded_version:
+            try:
+                labels.save(self.labels_path, self._graph_fingerprint(offsets, nbrs, wts))
+            except OSError as exc:
+                print(f"[hub-labels] Failed to save {self.labels_path}: {exc}")
+        return labels
+
+    # reuse the saved hub labels if they were built from the loaded relations
+    def _load_labels(self):
+        if self.graph.version != self.loaded_version:
+            return
+        offsets, nbrs, wts = self.graph.store.export_arrays()
+        fingerprint = self._graph_fingerprint(offsets, nbrs, wts)
+        if (labels := Hub_Labels.load(self.labels_path, fingerprint, self.graph.version)) is not None:
+            print(f"read hub labels from {self.labels_path}")
+            self.labels.index = labels
+
+    # union-find root of a node id in the published union-find (landmarks start from it)
+    def _root_id(self, node_id):
+        return self.snapshot()[1].find_id(node_id)
+
+    # swap in the graph and union-find readers see, after the relations changed (holding the write lock)
+        # readers keep the pair they took, so they never see a half done change and never wait for a writer
+        # the graph shares its unchanged arrays, but the union-find parents are copied whole (O(n), see UF_by_array.freeze)
+    def _publish(self):
+        store = self.graph.store.freeze()
+        self.published = (store, self.uf.freeze(store.names))
+
+    # (graph, union-find) of the last published version, for one read
+    def snapshot(self):
+        store, uf = self.published
+        return self.graph.with_store(store), uf
+
+    def check_relation(self, fri1, fri2, snapshot = None):
+        graph, uf = snapshot or self.snapshot()
+        if graph.check_data(fri1) and graph.check_data(fri2):
+            return uf.check_same_union(fri1, fri2)
         return False
 
     # three posible return values:
     # 1. (path_len, path_list) : found the best path
     # 2. (None, None) : no connection
     # 3. (None, []) : the path is too long (exceed limitation)
-    def get_best_path(self, fri1, fri2):
-        if not self.check_relation(fri1, fri2) :
+    # limit: None - the current limitation, 0 - unlimited
+    def get_best_path(self, fri1, fri2, limit = None):
+        snapshot = self.snapshot()
+        if not self.check_relation(fri1, fri2, snapshot) :
             return (None, None)
-        ret = self.graph.find_min_path(fri1, fri2)
-        check = self.graph.Dijkstra(fri1, fri2)
-        if ret[0] != check[0] :
-            print(check, ret)
-            raise Exception
+        graph = snapshot[0]
+        version, limit = graph.version, self._query_limit(limit, graph)
+        # cached results are verified too, a missed invalidation shows up as a mismatch
+        if (ret := self.cache.get(fri1, fri2, limit)) is None:
+            if (ret := self.trees.find_min_path(fri1, fri2, limit, graph)) is None:
+                ret = self._find_min_path(fri1, fri2, graph, limit)
+            self.cache.put(fri1, fri2, limit, ret, version)
+        self.verifier.submit(fri1, fri2, ret, limit, graph)
         return ret
+
+    # up to k shortest loopless paths, [(path_len, path_list), ...] from the best one
+    # None if there is no connection, [] if every path exceeds the limitation
+    def get_k_best_paths(self, fri1, fri2, k, limit = None):
+        snapshot = self.snapshot()
+        if not self.check_relation(fri1, fri2, snapshot):
+            return None
+        return snapshot[0].k_shortest_paths(fri1, fri2, k, self._query_limit(limit, snapshot[0]))
+
+    # get_best_path for many (fri1, fri2) pairs, results are in the same order with the same three posible values
+        # pairs are grouped by a shared person, and each group is answered by one search tree from that person
+    def get_best_paths(self, pairs, limit = None):
+        results = [None] * len(pairs)
+        pending = []
+        snapshot = self.snapshot()
+        graph = snapshot[0]
+        limit = self._query_limit(limit, graph)
+        for i, (fri1, fri2) in enumerate(pairs):
+            if not self.check_relation(fri1, fri2, snapshot):
+                results[i] = (None, None)
+            elif fri1 == fri2:
+                results[i] = (0, [fri1])
+            else:
+                pending.append(i)
+        # greedy grouping: each pair goes to the person who appears in more pending pairs
+        endpoint_cnt = defaultdict(int)
+        for i in pending:
+            for fri in pairs[i]:
+                endpoint_cnt[fri] += 1
+        groups = defaultdict(list) # root -> [(pair index, other person, reversed)]
+        for i in pending:
+            fri1, fri2 = pairs[i]
+            if endpoint_cnt[fri2] > endpoint_cnt[fri1]:
+                groups[fri2].append((i, fri1, True))
+            else:
+                groups[fri1].append((i, fri2, False))
+
+        if self.query_pool is not None:
+            # every group is one task, so the workers search in parallel
+            tasks = [(members, self.query_pool.submit_paths_from(root, [other for _, other, _ in members], limit))
+                     for root, members in groups.items()]
+            for members, task in tasks:
+                self._fill_group_results(results, members, task.result())
+            return results
+        names = graph.names
+        for root, members in groups.items():
+            if len(members) == 1:
+                i, _, _ = members[0]
+                results[i] = self._find_min_path(*pairs[i], graph, limit)
+                continue
+            found = graph._paths_from(names.get_id(root), [names.get_id(other) for _, other, _ in members], limit)
+            found = {names.get_name(other): (dist, names.to_names(path)) for other, (dist, path) in found.items()}
+            self._fill_group_results(results, members, found)
+        return results
+
+    # found: {other: (distance, path from the group root)}
+    def _fill_group_results(self, results, members, found):
+        for i, other, reverse in members:
+            if (ret := found.get(other)) is None:
+                results[i] = (None, []) # connected, but not within the limitation
+                continue
+            dist, path = ret
+            results[i] = (dist, path[::-1] if reverse else path)
+
+    # use the first up to date index (hub labels, contraction hierarchy, landmarks), otherwise search the graph itself
+        # graph: the snapshot the query started with, limit: the limitation of the query
+    def _find_min_path(self, fri1, fri2, graph, limit):
+        version = graph.version
+        if (index := self.labels.get(version) or self.ch.get(version)) is not None:
+            return self._find_min_path_index(index, fri1, fri2, graph, limit)
+        if self.query_pool is not None:
+            return self.query_pool.get_best_paths([(fri1, fri2)], limit)[0]
+        if (landmarks := self.landmarks.get(version)) is not None:
+            return graph.find_min_path_alt(fri1, fri2, landmarks, limit)
+        return graph.find_min_path(fri1, fri2, limit)
+
+    # index.find_min_path works on node ids
+    def _find_min_path_index(self, index, fri1, fri2, graph, limit):
+        if fri1 == fri2:
+            return (0, [fri1])
+        names = graph.names
+        dist, path = index.find_min_path(names.get_id(fri1), names.get_id(fri2), limit)
+        return (dist, names.to_names(path))
+
+    # run the same query with the plain and the landmark (ALT) bidirectional search
+    # return {mode: (path_len, path_list, expanded nodes)}, modes whose index is not ready are left out
+    def compare_search_modes(self, fri1, fri2):
+        graph, _ = self.snapshot()
+        results = {}
+        ret = graph.find_min_path(fri1, fri2)
+        results["bidirectional"] = (*ret, graph.last_expanded())
+        if (landmarks := self.landmarks.get(graph.version)) is not None:
+            ret = graph.find_min_path_alt(fri1, fri2, landmarks)
+            results["alt"] = (*ret, graph.last_expanded())
+        return results
     
+    # (name, path_len) of everyone reachable from start with a path shorter than limit, closest first
+        # limit: None - the current limitation, 0 - unlimited
+        # the whole listing comes from one snapshot, even when it is streamed while relations change
+    def get_reachable(self, start, limit = None):
+        if limit == 0:
+            limit = inf
+        return self.snapshot()[0].reachable(start, limit)
+
+    # one page of get_reachable, return (items, next offset or None if this is the last page)
+    def get_reachable_page(self, start, limit = None, offset = 0, page_size = 100):
+        items = list(islice(self.get_reachable(start, limit), offset, offset + page_size + 1))
+        if len(items) > page_size:
+            return items[:page_size], offset + page_size
+        return items, None
+
     # three posible return values:
     # 1. (path_len, path_list) : found the best path
     # 2. (None, None) : no connection
-    def find_target(self, start, target):
-        return self.graph.Dijkstra(start, target, find_info="summary", get_info=self.get_persona)
+    # limit: None - the current limitation, 0 - unlimited
+    def find_target(self, start, target, limit = None):
+        found = self.find_targets(start, target, 1, limit)
+        return found[0] if found else (None, None)
+
+    # [(path_len, path_list), ...] to the k closest people whose profile contains keyword, closest first
+        # the keyword index gives every matching person first, nobody matching needs no search
+        # with at most FEW_MATCHES matches in the component of start, each of them is searched towards start
+        # (with the path indexes), instead of sweeping the component from start until k of them are settled
+    FEW_MATCHES = 16
+
+    def find_targets(self, start, keyword, k = 1, limit = None):
+        if not (matches := self.find_personas(keyword)):
+            return []
+        snapshot = self.snapshot()
+        graph = snapshot[0]
+        limit = self._query_limit(limit, graph)
+        if (found := self.trees.find_targets(start, matches.__contains__, k, limit, graph)) is not None:
+            return found
+        reachable = [fri for fri in matches if fri == start or self.check_relation(start, fri, snapshot)]
+        if len(reachable) <= self.FEW_MATCHES:
+            found = []
+            for fri in reachable:
+                dist, path = self._find_min_path(fri, start, graph, limit)
+                if dist is not None:
+                    found.append((dist, graph.names.get_id(fri), path[::-1]))
+            return [(dist, path) for dist, _, path in sorted(found)[:k]]
+        if self.query_pool is not None:
+            return self.query_pool.find_targets(start, reachable, k, limit)
+        return graph.find_k_nearest(start, reachable, k, limit)
+    
+    # autocomplete: (names starting with query, False), or (names within a small edit distance, True) if none does
+    def suggest_names(self, query, limit = 10):
+        return self.name_index.suggest(query, limit)
     
     def get_all_nodes(self):
         """Get all unique nodes in the graph"""
-        nodes = set()
-        for node in self.graph.adj_matrix.keys():
-            nodes.add(node)
-            for neighbor in self.graph.adj_matrix[node].keys():
-                nodes.add(neighbor)
-        return list(nodes)
+        return self.snapshot()[0].get_all_nodes()
     
     def get_all_edges(self):
         """Get all edges with their weights"""
-        edges = []
-        seen = set()
-        for node1 in self.graph.adj_matrix:
-            for node2, weight in self.graph.adj_matrix[node1].items():
-                edge_tuple = tuple(sorted([node1, node2]))
-                if edge_tuple not in seen:
-                    seen.add(edge_tuple)
-                    edges.append({
-                        'source': node1,
-                        'target': node2,
-                        'weight': weight
-                    })
-        return edges
+        return [{
+                'source': node1,
+                'target': node2,
+                'weight': weight
+            } for node1, node2, weight in self.snapshot()[0].get_all_edges()]
     
     def get_graph_data(self):
         """Get complete graph data for visualization"""
@@ -160,11 +984,31 @@ class Backend:
     
     def get_connected_components(self):
         """Get all connected components in the graph"""
-        components = defaultdict(set)
-        for node in self.get_all_nodes():
-            root = self.uf.find(node)
-            components[root].add(node)
-        return [list(component) for component in components.values()]
+        to_names = self.graph.names.to_names
+        with self.write_lock:
+            return [to_names(members) for _, members in self.uf.components()]
+
+    def get_component_count(self):
+        return self.uf.component_cnt()
+
+    def get_components_page(self, offset = 0, page_size = 100, member_limit = 100):
+        """Return ([(root, size, first member_limit members), ...], next offset or None)"""
+        names = self.graph.names
+        with self.write_lock:
+            page = list(islice(self.uf.components(), offset, offset + page_size + 1))
+            items = [(names.get_name(root), len(members), names.to_names(members[:member_limit]))
+                     for root, members in page[:page_size]]
+        return items, (offset + page_size if len(page) > page_size else None)
+
+    def get_component(self, person, offset = 0, page_size = 100):
+        """Return (size, one page of members, next offset or None), or None if the person has no friends"""
+        if not self.graph.check_data(person):
+            return None
+        names = self.graph.names
+        with self.write_lock:
+            members = self.uf.members_of(names.get_id(person))
+            items = names.to_names(members[offset:offset + page_size])
+        return len(members), items, (offset + page_size if offset + page_size < len(members) else None)
 
 if __name__ == "__main__":
     backend = Backend('friendship_data.json')
@@ -0,0 +1,155 @@
+"""
+Micro benchmarks for the path search kernels of the Friend Connection System
+Usage:
+    python Benchmark.py                 # default graph size
+    python Benchmark.py 200000 5 2000   # people, average friends, queries
+"""
+
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from math import inf
+from heapq import heappush, heappop
+
+from Algorithm import Bidirectional_Dijkstra, Contraction_Hierarchy, Landmarks
+
+
+# ============================================================================
+# TEST DATA
+# ============================================================================
+
+def build_graph(people, avg_friends, seed = 0):
+    """Random social graph: a long chain (so every query has a long path) plus random friendships"""
+    rng = random.Random(seed)
+    graph = Bidirectional_Dijkstra()
+    for i in range(1, people):
+        graph.add_edge(f"P{i-1}", f"P{i}", rng.randint(1, 10))
+    for _ in range(people * avg_friends // 2):
+        a, b = rng.randrange(people), rng.randrange(people)
+        if a != b:
+            graph.add_edge(f"P{a}", f"P{b}", rng.randint(1, 10))
+    graph.compact()
+    return graph
+
+def build_queries(graph, count, seed = 1):
+    rng = random.Random(seed)
+    node_cnt = graph.store.node_cnt()
+    return [(rng.randrange(node_cnt), rng.randrange(node_cnt)) for _ in range(count)]
+
+
+# ============================================================================
+# KERNELS
+# ============================================================================
+
+def legacy_find_min_path(graph, start_fri, target_fri):
+    """The previous kernel: new dicts per query and a new path list per relaxation"""
+    neighbors = graph.store.neighbors
+    seen = [set(), set()]
+    dists = [{start_fri: 0}, {target_fri: 0}]
+    paths = [{start_fri: [start_fri]}, {target_fri: [target_fri]}]
+    node_heap = [(0, start_fri, 0), (0, target_fri, 1)]
+    min_dist = inf
+    min_path = []
+    while node_heap:
+        now_dist, now_fri, direct = heappop(node_heap)
+        if now_dist > dists[direct][now_fri]:
+            continue
+        if now_fri in seen[1 - direct]:
+            break
+        seen[direct].add(now_fri)
+        for new_fri, new_weight in neighbors(now_fri):
+            new_dist = now_dist + new_weight
+            if new_dist >= graph.weight_limitation:
+                continue
+            if new_dist < dists[direct].get(new_fri, inf):
+                dists[direct][new_fri] = new_dist
+                heappush(node_heap, (new_dist, new_fri, direct))
+                paths[direct][new_fri] = paths[direct][now_fri] + [new_fri]
+                if new_fri in dists[0] and new_fri in dists[1]:
+                    totaldist = dists[0][new_fri] + dists[1][new_fri]
+                    if totaldist < graph.weight_limitation and min_dist > totaldist:
+                        min_dist = totaldist
+                        min_path = paths[0][new_fri][:-1] + paths[1][new_fri][::-1]
+    if min_dist == inf:
+        return (None, [])
+    return (min_dist, min_path)
+
+def run_kernel(kernel, queries, expanded = None):
+    """Return (results, seconds, peak traced bytes, expanded nodes)
+    expanded() returns the nodes expanded by the last query, if the kernel counts them"""
+    kernel(*queries[0]) # warm up (grows the scratch buffers once)
+    start = time.perf_counter()
+    results = [kernel(s, t) for s, t in queries]
+    seconds = time.perf_counter() - start
+    expanded_cnt = None
+    if expanded is not None:
+        expanded_cnt = 0
+        for s, t in queries:
+            kernel(s, t)
+            expanded_cnt += expanded()
+    tracemalloc.start()
+    for s, t in queries[:100]:
+        kernel(s, t)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return results, seconds, peak, expanded_cnt
+
+def run_thread_per_query(kernel, queries):
+    """Return seconds to run every query in a new thread, like a threaded server does per request"""
+    def run(s, t):
+        kernel(s, t)
+    start = time.perf_counter()
+    for s, t in queries:
+        worker = threading.Thread(target=run, args=(s, t))
+        worker.start()
+        worker.join()
+    return time.perf_counter() - start
+
+
+# ============================================================================
+# MAIN EXECUTION
+# ============================================================================
+
+def main():
+    people, avg_friends, query_cnt = 50000, 3, 500
+    if len(sys.argv) > 1:
+        people, avg_friends, query_cnt = (int(arg) for arg in (sys.argv[1:] + ["3", "500"])[:3])
+
+    print(f"building graph: {people} people, ~{avg_friends} friends each")
+    graph = build_graph(people, avg_friends)
+    queries = build_queries(graph, query_cnt)
+    start = time.perf_counter()
+    ch = Contraction_Hierarchy(*graph.store.export_arrays(), graph.version)
+    print(f"contraction hierarchy: {time.perf_counter() - start:.1f}s to build, "
+          f"{len(ch.up_nbrs)} upward edges, {ch.core_cnt} core nodes")
+    start = time.perf_counter()
+    landmarks = Landmarks(*graph.store.export_arrays(), graph.version)
+    print(f"landmarks: {time.perf_counter() - start:.1f}s to build")
+
+    kernels = [
+        ("legacy find_min_path", lambda s, t: legacy_find_min_path(graph, s, t), None),
+        ("find_min_path", graph._find_min_path, graph.last_expanded),
+        ("alt", lambda s, t: graph._find_min_path_alt(s, t, landmarks), graph.last_expanded),
+        ("contraction hierarchy", ch.find_min_path, None),
+    ]
+    baseline = None
+    print(f"\n{'kernel':<24}{'total (s)':>12}{'per query (ms)':>16}{'peak alloc (KB)':>18}{'expanded':>12}")
+    for name, kernel, expanded in kernels:
+        results, seconds, peak, expanded_cnt = run_kernel(kernel, queries, expanded)
+        if baseline is None:
+            baseline = results
+        elif [r[0] for r in results] != [r[0] for r in baseline]:
+            print(f"  !! {name} returned different distances from the legacy kernel")
+        expanded_cnt = "-" if expanded_cnt is None else expanded_cnt
+        print(f"{name:<24}{seconds:>12.3f}{seconds / len(queries) * 1000:>16.3f}{peak / 1024:>18.1f}{expanded_cnt:>12}")
+
+    # the scratch buffers come from a pool, so a new thread per query should cost about the thread start only
+    seconds = run_thread_per_query(graph._find_min_path, queries)
+    print(f"\nfind_min_path, one thread per query: {seconds:.3f}s total, {seconds / len(queries) * 1000:.3f} ms per query, "
+          f"{graph.spaces.created} search spaces built")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import atexit
+import multiprocessing
+import pickle
+import threading
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from Algorithm import Bidirectional_Dijkstra, CSR_Graph, Name_Table
+
+# one snapshot is one shared memory segment:
+    # header (offsets length, nbrs length, pickled names length, weight typecode), offsets, nbrs, wts, pickled names
+    # every part starts at a multiple of 8 bytes
+HEADER_LEN = 4
+ALIGN = 8
+
+def _aligned(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+def _write_snapshot(offsets, nbrs, wts, names):
+    blob = pickle.dumps(names, protocol=pickle.HIGHEST_PROTOCOL)
+    header = array("q", [len(offsets), len(nbrs), len(blob), ord(wts.typecode)])
+    parts = [memoryview(part).cast("B") for part in (header, offsets, nbrs, wts)] + [memoryview(blob)]
+    shm = shared_memory.SharedMemory(create=True, size=sum(_aligned(len(part)) for part in parts))
+    pos = 0
+    for part in parts:
+        shm.buf[pos:pos + len(part)] = part
+        pos += _aligned(len(part))
+    return shm
+
+# a read-only CSR_Graph over the segment, only the names are copied out of it
+def _read_snapshot(buf):
+    offsets_len, nbrs_len, names_len, weight_code = buf[:HEADER_LEN * 8].cast("q")
+    pos = _aligned(HEADER_LEN * 8)
+    parts = []
+    for code, length in (("q", offsets_len), (CSR_Graph.ID_CODE, nbrs_len), (chr(weight_code), nbrs_len)):
+        size = array(code).itemsize * length
+        parts.append(buf[pos:pos + size].cast(code))
+        pos += _aligned(size)
+    names = Name_Table()
+    for name in pickle.loads(buf[pos:pos + names_len]):
+        names.intern(name)
+    return CSR_Graph.from_buffers(*parts, names)
+
+
+# ============================================================================
+# WORKER SIDE
+# ============================================================================
+
+_attached = None # (segment name, shared memory, graph) of the snapshot this worker uses
+    # (spawned workers share the resource tracker of the parent, which unlinks the segments, so they are not unregistered here)
+
+def _attach(segment):
+    global _attached
+    if _attached is None or _attached[0] != segment:
+        if _attached is None:
+            atexit.register(lambda : _attached and _detach(_attached))
+        else:
+            _detach(_attached)
+        shm = shared_memory.SharedMemory(name=segment)
+        _attached = (segment, shm, Bidirectional_Dijkstra(store=_read_snapshot(shm.buf)))
+    return _attached[2]
+
+# a segment can only be closed after every view of it is released
+def _detach(attached):
+    _, shm, graph = attached
+    store = graph.store
+    for view in (store.nbr_view, store.wt_view, store.offsets, store.nbrs, store.wts):
+        view.release()
+    shm.close()
+
+def _best_paths(segment, limit, pairs):
+    graph = _attach(segment)
+    return [graph.find_min_path(fri1, fri2, limit) for fri1, fri2 in pairs]
+
+# one search tree from root, return {other: (distance, path)} like Bidirectional_Dijkstra._paths_from but with names
+def _paths_from(segment, limit, root, others):
+    graph = _attach(segment)
+    names = graph.names
+    found = graph._paths_from(names.get_id(root), [names.get_id(other) for other in others], limit)
+    return {names.get_name(other): (dist, names.to_names(path)) for other, (dist, path) in found.items()}
+
+def _find_targets(segment, limit, start, targets, k):
+    graph = _attach(segment)
+    return graph.find_k_nearest(start, targets, k, limit)
+
+
+# ============================================================================
+# PARENT SIDE
+# ============================================================================
+
+# runs path queries in worker processes, which attach to a read-only snapshot of the graph in shared memory
+    # a new snapshot generation is published by the first query after the graph changed,
+    # old segments are unlinked when no query uses them anymore
+    # spawned workers import the main module again, use start_method="fork" if it is not safe to import
+class Query_Pool:
+    def __init__(self, graph, write_lock, workers = None, start_method = "spawn"):
+        self.graph = graph
+        self.write_lock = write_lock
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(start_method))
+        self.lock = threading.Lock()
+        self.segment = None # current shared memory segment
+        self.version = None # graph version of the current segment
+        self.generation = 0
+        self.running = defaultdict(int) # segment name -> queries using it
+        self.retired = {} # segment name -> old segment waiting for its queries
+
+    def _publish(self):
+        with self.write_lock:
+            offsets, nbrs, wts = self.graph.store.export_arrays()
+            names = self.graph.names.names[:len(offsets) - 1]
+            version = self.graph.version
+        segment = _write_snapshot(offsets, nbrs, wts, names)
+        if (old := self.segment) is not None:
+            self.retired[old.name] = old
+            self._unlink_unused(old.name)
+        self.segment, self.version = segment, version
+        self.generation += 1
+
+    def _unlink_unused(self, name):
+        if self.running[name] == 0 and (segment := self.retired.pop(name, None)) is not None:
+            del self.running[name]
+            segment.close()
+            segment.unlink()
+
+    def _release(self, name):
+        with self.lock:
+            self.running[name] -= 1
+            self._unlink_unused(name)
+
+    # every task gets the limitation of its own query (None - the current limitation)
+    def submit(self, fn, limit, *args):
+        if limit is None:
+            limit = self.graph.weight_limitation
+        with self.lock:
+            if self.version != self.graph.version:
+                self._publish()
+            name = self.segment.name
+            self.running[name] += 1
+        future = self.executor.submit(fn, name, limit, *args)
+        future.add_done_callback(lambda _: self._release(name))
+        return future
+
+    def get_best_paths(self, pairs, limit = None):
+        return self.submit(_best_paths, limit, pairs).result()
+
+    # future of {other: (distance, path)} of the others reachable from root within the limitation
+    def submit_paths_from(self, root, others, limit = None):
+        return self.submit(_paths_from, limit, root, others)
+
+    # (distance, path) to the closest of the targets (a set of names)
+    def find_target(self, start, targets, limit = None):
+        found = self.find_targets(start, targets, 1, limit)
+        return found[0] if found else (None, None)
+
+    # [(distance, path), ...] to the k closest of the targets
+    def find_targets(self, start, targets, k, limit = None):
+        return self.submit(_find_targets, limit, start, targets, k).result()
+
+    def close(self):
+        self.executor.shutdown()
+        with self.lock:
+            if self.segment is not None:
+                self.retired[self.segment.name] = self.segment
+                self.segment = self.version = None
+            for name in list(self.retired):
+                self._unlink_unused(name)
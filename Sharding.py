@@ -0,0 +1,204 @@
+import multiprocessing
+import threading
+from pathlib import Path
+
+from Algorithm import Bidirectional_Dijkstra, UF_by_array, Name_Table
+from Backend import read_relations
+
+# one worker process of Sharded_Backend, it only holds the relations of the components given to it
+    # requests are (op, args) tuples, every request gets one (ok, result or error message) answer
+def _shard_worker(conn):
+    graph = Bidirectional_Dijkstra()
+
+    def add_edges(edges):
+        return sum(graph.add_edge(fri1, fri2, score)[2] is None for fri1, fri2, score in edges)
+
+    # remove and return every relation of these people (whole components, so no relation leaves the group)
+    def take(members):
+        names, store = graph.names, graph.store
+        edges = []
+        for fri in members:
+            if (u := names.get_id(fri)) is None:
+                continue
+            for v, w in list(store.neighbors(u)):
+                if u < v:
+                    edges.append((fri, names.get_name(v), w))
+        for fri1, fri2, _ in edges:
+            graph.remove_edge(fri1, fri2)
+        return edges
+
+    def best_paths(pairs, limit = None):
+        return [graph.find_min_path(fri1, fri2, limit) for fri1, fri2 in pairs]
+
+    ops = {
+        "add_edges": add_edges,
+        "take": take,
+        "best_paths": best_paths,
+        "set_limitation": graph.set_limitation,
+    }
+    while True:
+        try:
+            op, args = conn.recv()
+        except EOFError:
+            return
+        if op == "stop":
+            conn.send((True, None))
+            return
+        try:
+            conn.send((True, ops[op](*args)))
+        except Exception as exc:
+            conn.send((False, f"{type(exc).__name__}: {exc}"))
+
+# the router side of one worker process
+class Shard:
+    def __init__(self, index, context):
+        self.index = index
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_shard_worker, args=(child_conn,), name=f"shard-{index}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.lock = threading.Lock() # one request at a time on the pipe
+        self.edge_cnt = 0 # relations held by the worker, used to place components
+
+    def send(self, op, *args):
+        self.conn.send((op, args))
+
+    def recv(self):
+        ok, result = self.conn.recv()
+        if not ok:
+            raise RuntimeError(f"[shard-{self.index}] {result}")
+        return result
+
+    def call(self, op, *args):
+        with self.lock:
+            self.send(op, *args)
+            return self.recv()
+
+    def stop(self):
+        try:
+            self.call("stop")
+        except (EOFError, OSError):
+            pass
+        self.process.join()
+
+# Backend mode which spreads the components over several worker processes
+    # the router keeps the union-find (names only) and which shard owns each component,
+    # a query between two people of one component goes to the shard of that component,
+    # a query between different components is answered by the union-find like check_relation
+    # when add_relation merges components of two shards, the smaller component moves to the other shard
+    # only the methods below are supported (see the README), the web apps do not use this class
+class Sharded_Backend:
+    def __init__(self, path, shard_cnt = 2):
+        self.names = Name_Table()
+        self.uf = UF_by_array(self.names)
+        self.shard_of = {} # component root id -> Shard (single-member sets have no shard)
+        self.lock = threading.Lock() # held while routing or changing the components
+        self.move_cnt = 0
+        context = multiprocessing.get_context("spawn")
+        self.shards = [Shard(i, context) for i in range(shard_cnt)]
+        if path:
+            self._load(Path(path))
+
+    def _load(self, data_path):
+        if not data_path.exists():
+            raise FileNotFoundError(f"Friendship data file not found: {data_path}")
+        relations = list(read_relations(data_path))
+        intern = self.names.intern
+        self.uf.union_many([(intern(fri1), intern(fri2)) for fri1, fri2, _ in relations])
+        edges = {} # component root id -> relations
+        for relation in relations:
+            edges.setdefault(self.uf.find_id(self.names.get_id(relation[0])), []).append(relation)
+        # biggest components first, each to the shard holding the fewest relations
+        for root, component_edges in sorted(edges.items(), key=lambda item: -len(item[1])):
+            shard = min(self.shards, key=lambda shard: shard.edge_cnt)
+            self.shard_of[root] = shard
+            shard.edge_cnt += len(component_edges)
+        for shard in self.shards:
+            shard.send("add_edges", [relation for root, component_edges in edges.items()
+                                     if self.shard_of[root] is shard for relation in component_edges])
+        for shard in self.shards:
+            shard.recv()
+
+    def close(self):
+        for shard in self.shards:
+            shard.stop()
+
+    def check_relation(self, fri1, fri2):
+        names = self.names
+        if (u := names.get_id(fri1)) is None or (v := names.get_id(fri2)) is None:
+            return False
+        return self.uf.find_id(u) == self.uf.find_id(v)
+
+    def set_limitation(self, limit):
+        if limit == 0 :
+            limit = float('inf')
+        for shard in self.shards:
+            shard.call("set_limitation", limit)
+
+    # same return values as Backend.get_best_path
+    def get_best_path(self, fri1, fri2, limit = None):
+        return self.get_best_paths([(fri1, fri2)], limit)[0]
+
+    # pairs are sent to their shards in one request per shard, the shards answer in parallel
+        # limit: None - the limitation of the shards, 0 - unlimited
+    def get_best_paths(self, pairs, limit = None):
+        if limit == 0:
+            limit = float('inf')
+        results = [(None, None)] * len(pairs)
+        by_shard = {} # Shard -> [pair index, ...]
+        with self.lock:
+            for i, (fri1, fri2) in enumerate(pairs):
+                if self.check_relation(fri1, fri2):
+                    by_shard.setdefault(self.shard_of[self.uf.find_id(self.names.get_id(fri1))], []).append(i)
+            # take the shard locks before letting a component move again (always in shard order)
+            shards = sorted(by_shard, key=lambda shard: shard.index)
+            for shard in shards:
+                shard.lock.acquire()
+        try:
+            for shard in shards:
+                shard.send("best_paths", [pairs[i] for i in by_shard[shard]], limit)
+            for shard in shards:
+                for i, result in zip(by_shard[shard], shard.recv()):
+                    results[i] = result
+        finally:
+            for shard in shards:
+                shard.lock.release()
+        return results
+
+    def add_relation(self, fri1, fri2, connection_score):
+        with self.lock:
+            uf, intern = self.uf, self.names.intern
+            root1, root2 = uf.find_id(intern(fri1)), uf.find_id(intern(fri2))
+            shard1, shard2 = self.shard_of.get(root1), self.shard_of.get(root2)
+            if shard1 is None or shard2 is None:
+                shard = shard1 or shard2 or min(self.shards, key=lambda shard: shard.edge_cnt)
+            elif shard1 is shard2:
+                shard = shard1
+            else:
+                # rebalance: move the smaller component to the shard of the bigger one
+                if uf.set_size(root1) > uf.set_size(root2):
+                    root1, root2, shard1, shard2 = root2, root1, shard2, shard1
+                self._move(root1, shard1, shard2)
+                shard = shard2
+            self.shard_of.pop(root1, None)
+            self.shard_of.pop(root2, None)
+            uf.union_id(root1, root2)
+            self.shard_of[uf.find_id(root1)] = shard
+            shard.edge_cnt += shard.call("add_edges", [(fri1, fri2, connection_score)])
+
+    def _move(self, root, source, target):
+        edges = source.call("take", self.names.to_names(self.uf.members_of(root)))
+        target.call("add_edges", edges)
+        source.edge_cnt -= len(edges)
+        target.edge_cnt += len(edges)
+        self.move_cnt += 1
+        print(f"[shard] moved a component of {self.uf.set_size(root)} people "
+              f"from shard {source.index} to shard {target.index}")
+
+    # (shard index, components, relations) of every shard
+    def shard_stats(self):
+        with self.lock:
+            components = [0] * len(self.shards)
+            for shard in self.shard_of.values():
+                components[shard.index] += 1
+            return [(shard.index, components[shard.index], shard.edge_cnt) for shard in self.shards]
@@ -4,16 +4,24 @@ This single file contains all tests, demo, and test data generation
 """
 
 import unittest
+import asyncio
+import json
 import os
 import sys
+import threading
+from unittest import mock
 from Backend import Backend
-from Algorithm import UF_by_size, Bidirectional_Dijkstra
+from Algorithm import UF_by_size, UF_by_array, Bidirectional_Dijkstra, Prefix_Index, fuzzy_prefix_distance
+import tempfile
+from pathlib import Path
+from persona_data import (DATA_FILE, Dict_Persona_Store, SQLite_Persona_Store, convert_to_sqlite, find_personas,
+                          get_all_personas, get_personas, get_personas_page)
 
 
 # ============================================================================
 # UNIT TEST CLASS
 # ============================================================================
-test_dir = r"D:\dont_move\relation_file.csv"
+test_dir = str(Path(__file__).with_name("relation_file.csv"))
 
 class TestBackend(unittest.TestCase):
     """Comprehensive unit tests for the Backend class"""
@@ -36,7 +44,7 @@ class TestBackend(unittest.TestCase):
         
         self.assertIsNotNone(self.backend.uf, "Union-Find should be initialized")
         self.assertIsNotNone(self.backend.graph, "Graph should be initialized")
-        self.assertIsInstance(self.backend.uf, UF_by_size, "Should use UF_by_size class")
+        self.assertIsInstance(self.backend.uf, UF_by_array, "Should use UF_by_array class")
         self.assertIsInstance(self.backend.graph, Bidirectional_Dijkstra, "Should use Bidirectional_Dijkstra class")
         
         print("  ✓ Backend initialized with correct data structures")
@@ -260,6 +268,7 @@ class TestBackend(unittest.TestCase):
             ("Sam", "Victor"),
         ]
         
+        self.backend.set_verification("always")
         for start, end in test_cases:
             try:
                 dist, path = self.backend.get_best_path(start, end)
@@ -268,6 +277,797 @@ class TestBackend(unittest.TestCase):
                 print(f"  ✓ {start} → {end}: Verification passed")
             except Exception as e:
                 self.fail(f"Verification failed for {start} to {end}: {e}")
+        self.backend.verifier.join()
+        self.assertEqual(self.backend.verifier.checked_cnt, len(test_cases))
+        self.assertEqual(len(self.backend.verifier.mismatches), 0)
+
+    # ------------------------------------------------------------------------
+    # TEST 12: CSR GRAPH STORE
+    # ------------------------------------------------------------------------
+    def test_12_csr_graph_store(self):
+        """Test that the interned CSR store keeps edges consistent across compaction"""
+        print("\n[TEST 12] Testing CSR graph store...")
+        
+        graph = self.backend.graph
+        store = graph.store
+        alice = graph.names.get_id("Alice")
+        self.assertIsNotNone(alice)
+        self.assertIsNone(graph.names.get_id("Zoe"), "Queries should not intern unknown names")
+        self.assertEqual(graph.names.get_name(alice), "Alice")
+        self.assertEqual(store.rows, {}, "Loaded data should be compacted")
+        print("  ✓ Names are interned and loaded rows are compacted")
+        
+        # update an existing edge and add a new one, before and after compaction
+        bob = graph.names.get_id("Bob")
+        self.assertEqual(store.weight(alice, bob), 5)
+        edge_cnt = store.edge_cnt
+        graph.add_edge("Alice", "Bob", 1)
+        graph.add_edge("Alice", "Zoe", 4)
+        self.assertEqual(store.edge_cnt, edge_cnt + 1)
+        for _ in range(2):
+            self.assertEqual(store.weight(bob, alice), 1)
+            self.assertEqual(store.weight(alice, graph.names.get_id("Zoe")), 4)
+            self.assertEqual(sorted(graph.get_all_nodes()), sorted(set(n for e in graph.get_all_edges() for n in e[:2])))
+            self.assertEqual(len(list(graph.get_all_edges())), store.edge_cnt)
+            store.compact()
+        self.assertEqual(graph.find_min_path("Zoe", "Charlie"), (8, ["Zoe", "Alice", "Bob", "Charlie"]))
+        print("  ✓ Edge updates survive compaction")
+
+    # ------------------------------------------------------------------------
+    # TEST 13: REUSED SEARCH BUFFERS
+    # ------------------------------------------------------------------------
+    def test_13_search_buffers_reused(self):
+        """Test that queries sharing scratch buffers do not see each other's state"""
+        print("\n[TEST 13] Testing reused search buffers...")
+        
+        graph = self.backend.graph
+        nodes = sorted(graph.get_all_nodes())
+        def run_queries():
+            for start in nodes:
+                for end in nodes:
+                    dist, path = graph.find_min_path(start, end)
+                    self.assertEqual(dist, graph.Dijkstra(start, end)[0], f"{start} → {end} distance mismatch")
+                    if dist is not None:
+                        self.assertEqual((path[0], path[-1]), (start, end))
+                        self.assertEqual(sum(graph.store.weight(graph.names.get_id(a), graph.names.get_id(b))
+                                             for a, b in zip(path, path[1:])), dist)
+        run_queries()
+        created = graph.spaces.created
+        # a new thread per query batch, like a threaded server, still reuses the pooled buffers
+        errors = []
+        def run_in_thread():
+            try:
+                run_queries()
+            except AssertionError as exc:
+                errors.append(exc)
+        for _ in range(2):
+            worker = threading.Thread(target=run_in_thread)
+            worker.start()
+            worker.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(graph.spaces.created, created, "Sequential threads should not build new buffers")
+        print(f"  ✓ {len(nodes) ** 2 * 3} queries agree with Dijkstra")
+
+    # ------------------------------------------------------------------------
+    # TEST 14: VERIFICATION MISMATCH IS LOGGED
+    # ------------------------------------------------------------------------
+    def test_14_verification_mismatch_logged(self):
+        """Test that a verification mismatch is recorded instead of failing the request"""
+        print("\n[TEST 14] Testing verification modes...")
+        
+        verifier = self.backend.verifier
+        self.backend.set_verification("off")
+        self.backend.get_best_path("Alice", "Charlie")
+        verifier.join()
+        self.assertEqual(verifier.checked_cnt, 0)
+        print("  ✓ Mode off: no check queued")
+        
+        self.backend.set_verification("sampled", 100)
+        with mock.patch.object(Bidirectional_Dijkstra, "Dijkstra", lambda self, start, target, limit = None: (1, [start, target])):
+            self.assertEqual(self.backend.get_best_path("Alice", "Charlie"), (8, ["Alice", "Bob", "Charlie"]))
+            verifier.join()
+        self.assertEqual(verifier.checked_cnt, 1)
+        fri1, fri2, version, result, check = verifier.mismatches[-1]
+        self.assertEqual((fri1, fri2, version), ("Alice", "Charlie", self.backend.graph.version))
+        print("  ✓ Mismatch recorded with query and graph version")
+        
+        # a change after the query does not reach the check of its snapshot
+        graph = self.backend.snapshot()[0]
+        result = graph.find_min_path("Alice", "Charlie")
+        self.backend.add_relation("Alice", "Charlie", 1)
+        verifier.submit("Alice", "Charlie", result, float('inf'), graph)
+        verifier.join()
+        self.assertEqual((verifier.checked_cnt, len(verifier.mismatches)), (2, 1))
+        print("  ✓ Checks run on the snapshot of their query")
+        
+        with self.assertRaises(ValueError):
+            self.backend.set_verification("sometimes")
+
+    # ------------------------------------------------------------------------
+    # TEST 15: CONTRACTION HIERARCHY
+    # ------------------------------------------------------------------------
+    def test_15_contraction_hierarchy(self):
+        """Test that the contraction hierarchy answers like the bidirectional search and follows changes"""
+        print("\n[TEST 15] Testing contraction hierarchy index...")
+        
+        graph = self.backend.graph
+        self.assertIsNone(self.backend.ch.get(graph.version), "Index should be off by default")
+        self.backend.ch.delay = 0
+        self.backend.set_contraction_hierarchy(True)
+        self.backend.ch.join()
+        ch = self.backend.ch.get(graph.version)
+        self.assertIsNotNone(ch, "Index should be built once turned on")
+        nodes = graph.get_all_nodes()
+        for limit in (float('inf'), 6):
+            graph.set_limitation(limit)
+            for start in nodes:
+                for end in nodes:
+                    expected = graph.find_min_path(start, end)
+                    dist, path = ch.find_min_path(graph.names.get_id(start), graph.names.get_id(end), limit)
+                    self.assertEqual(dist, expected[0], f"{start} → {end} with limit {limit}")
+                    if dist is not None: # ties may pick another path of the same length
+                        self.assertEqual((path[0], path[-1]), (graph.names.get_id(start), graph.names.get_id(end)))
+                        self.assertEqual(sum(graph.store.weight(a, b) for a, b in zip(path, path[1:])), dist)
+        graph.set_limitation(float('inf'))
+        print("  ✓ Index agrees with bidirectional Dijkstra")
+        
+        self.backend.add_relation("Charlie", "Emily", 1)
+        self.assertIsNone(self.backend.ch.get(graph.version), "Index should be stale after add_relation")
+        self.assertEqual(self.backend.get_best_path("Alice", "Emily")[0], 9)
+        self.backend.ch.join()
+        self.assertIsNotNone(self.backend.ch.get(graph.version))
+        self.assertEqual(self.backend.get_best_path("Alice", "Emily"), (9, ["Alice", "Bob", "Charlie", "Emily"]))
+        print("  ✓ Index is rebuilt in the background after add_relation")
+
+    # ------------------------------------------------------------------------
+    # TEST 16: LANDMARK (ALT) SEARCH
+    # ------------------------------------------------------------------------
+    def test_16_alt_search(self):
+        """Test that the landmark A* search finds the same distances and reports expanded nodes"""
+        print("\n[TEST 16] Testing ALT search mode...")
+        
+        self.assertIsNone(self.backend.landmarks.index, "Landmarks are off by default")
+        self.backend.landmarks.delay = 0
+        self.backend.set_landmarks(True)
+        self.backend.landmarks.join()
+        landmarks = self.backend.landmarks.get(self.backend.graph.version)
+        self.assertIsNotNone(landmarks)
+        self.assertEqual(len(landmarks.landmarks), 6, "Each component should get its own landmarks")
+        root = self.backend.graph.names.get_id(self.backend.uf.find("Alice"))
+        self.assertIn(root, [lms[0] for lms in landmarks.landmarks], "Union-find root should be a landmark")
+        
+        nodes = self.backend.get_all_nodes()
+        for limit in (float('inf'), 6):
+            self.backend.graph.set_limitation(limit)
+            for start in nodes:
+                for end in nodes:
+                    results = self.backend.compare_search_modes(start, end)
+                    self.assertEqual(results["alt"][0], results["bidirectional"][0], f"{start} → {end}")
+                    if start != end and results["alt"][0] is not None:
+                        self.assertGreater(results["alt"][2], 0)
+                        self.assertEqual((results["alt"][1][0], results["alt"][1][-1]), (start, end))
+        print("  ✓ ALT agrees with bidirectional Dijkstra")
+
+    # ------------------------------------------------------------------------
+    # TEST 17: BOUNDED REACHABILITY
+    # ------------------------------------------------------------------------
+    def test_17_get_reachable(self):
+        """Test listing everyone within a limit, closest first, in pages"""
+        print("\n[TEST 17] Testing bounded reachability...")
+        
+        reachable = list(self.backend.get_reachable("Ivan", 10))
+        self.assertEqual(reachable, [("Julia", 2), ("Kevin", 5), ("Laura", 9)])
+        self.assertEqual(list(self.backend.get_reachable("Ivan", 9)), [("Julia", 2), ("Kevin", 5)])
+        self.assertEqual(list(self.backend.get_reachable("Zoe", 10)), [])
+        print("  ✓ Ivan within 10: " + ", ".join(f"{n}({d})" for n, d in reachable))
+        
+        everyone = list(self.backend.get_reachable("Alice", 0))
+        self.assertEqual([n for n, _ in everyone], ["Bob", "Charlie", "David"])
+        pages, offset = [], 0
+        while offset is not None:
+            items, offset = self.backend.get_reachable_page("Alice", 0, offset or 0, 2)
+            pages.append(items)
+        self.assertEqual(pages, [everyone[:2], everyone[2:]])
+        print("  ✓ Pages concatenate to the full result")
+
+    # ------------------------------------------------------------------------
+    # TEST 18: BATCHED PATH QUERIES
+    # ------------------------------------------------------------------------
+    def test_18_get_best_paths_batch(self):
+        """Test that batched queries give the same three-way results as get_best_path"""
+        print("\n[TEST 18] Testing batched path queries...")
+        
+        nodes = self.backend.get_all_nodes() + ["Zoe"]
+        pairs = [(start, end) for start in nodes for end in nodes]
+        for limit in (float('inf'), 6):
+            self.backend.set_limitation(limit)
+            results = self.backend.get_best_paths(pairs)
+            for (start, end), (dist, path) in zip(pairs, results):
+                expected = self.backend.get_best_path(start, end)
+                self.assertEqual(dist, expected[0], f"{start} → {end} with limit {limit}")
+                if dist is None:
+                    self.assertEqual(path, expected[1], f"{start} → {end} should be {expected}")
+                else:
+                    self.assertEqual((path[0], path[-1]), (start, end))
+        self.assertEqual(self.backend.get_best_paths([("Alice", "Emily"), ("Ivan", "Laura")]), [(None, None), (None, [])])
+        print(f"  ✓ {len(pairs) * 2} batched pairs agree with get_best_path")
+
+    # ------------------------------------------------------------------------
+    # TEST 19: K SHORTEST PATHS
+    # ------------------------------------------------------------------------
+    def test_19_k_best_paths(self):
+        """Test the k shortest loopless alternative paths"""
+        print("\n[TEST 19] Testing k shortest paths...")
+        
+        paths = self.backend.get_k_best_paths("Ivan", "Kevin", 5)
+        self.assertEqual(paths, [
+            (5, ["Ivan", "Julia", "Kevin"]),
+            (13, ["Ivan", "Julia", "Laura", "Kevin"]),
+            (16, ["Ivan", "Laura", "Kevin"]),
+            (22, ["Ivan", "Laura", "Julia", "Kevin"]),
+        ])
+        print(f"  ✓ Ivan → Kevin has {len(paths)} loopless paths")
+        
+        self.backend.set_limitation(14)
+        self.assertEqual([d for d, _ in self.backend.get_k_best_paths("Ivan", "Kevin", 5)], [5, 13])
+        self.assertEqual(self.backend.get_k_best_paths("Ivan", "Kevin", 1), [(5, ["Ivan", "Julia", "Kevin"])])
+        self.assertIsNone(self.backend.get_k_best_paths("Alice", "Emily", 3))
+        self.backend.set_limitation(3)
+        self.assertEqual(self.backend.get_k_best_paths("Ivan", "Kevin", 3), [])
+        print("  ✓ Limitation prunes the alternatives")
+
+    # ------------------------------------------------------------------------
+    # TEST 20: HUB LABELS
+    # ------------------------------------------------------------------------
+    def test_20_hub_labels(self):
+        """Test the hub label distance oracle, its path unpacking and its saved file"""
+        print("\n[TEST 20] Testing hub labels...")
+        
+        graph = self.backend.graph
+        self.assertIsNone(self.backend.labels.get(graph.version), "Hub labels should be off by default")
+        self.backend.labels.delay = 0
+        self.backend.set_hub_labels(True)
+        self.backend.labels.join()
+        labels = self.backend.labels.get(graph.version)
+        self.assertIsNotNone(labels)
+        nodes = graph.get_all_nodes()
+        for start in nodes:
+            for end in nodes:
+                expected = graph.find_min_path(start, end)
+                dist, path = labels.find_min_path(graph.names.get_id(start), graph.names.get_id(end))
+                self.assertEqual(dist, expected[0], f"{start} → {end}")
+                if dist is not None:
+                    path = graph.names.to_names(path)
+                    self.assertEqual((path[0], path[-1]), (start, end))
+                    self.assertEqual(sum(graph.store.weight(graph.names.get_id(a), graph.names.get_id(b))
+                                         for a, b in zip(path, path[1:])), dist)
+        self.assertEqual(labels.find_min_path(graph.names.get_id("Ivan"), graph.names.get_id("Laura"), 9), (None, []))
+        print(f"  ✓ {labels.label_size()} label entries answer every pair")
+        
+        self.backend._build_labels(*graph.store.export_arrays(), graph.version) # save again, other tests change the graph
+        backend2 = Backend(test_dir)
+        backend2.labels.delay = 0.2
+        backend2.set_hub_labels(True)
+        self.assertIsNotNone(backend2.labels.get(backend2.graph.version), "Saved labels should be loaded")
+        self.assertEqual(backend2.labels.build_cnt, 0)
+        self.assertEqual(backend2.get_best_path("Ivan", "Kevin"), (5, ["Ivan", "Julia", "Kevin"]))
+        mtime = os.path.getmtime(backend2.labels_path)
+        backend2.add_relation("Ivan", "Kevin", 1)
+        backend2.add_relation("Ivan", "Laura", 1)
+        self.assertIsNone(backend2.labels.get(backend2.graph.version))
+        backend2.labels.join()
+        self.assertEqual(backend2.labels.build_cnt, 1, "Changes in a burst should cause one rebuild")
+        self.assertEqual(backend2.get_best_path("Ivan", "Kevin"), (1, ["Ivan", "Kevin"]))
+        self.assertEqual(os.path.getmtime(backend2.labels_path), mtime, "Labels of a changed graph are not saved")
+        print("  ✓ Labels are loaded from disk and rebuilt once after a burst of changes")
+        
+        backend2.labels.max_nodes = 3
+        backend2.add_relation("Ivan", "Mike", 1)
+        backend2.labels.join()
+        self.assertIsNone(backend2.labels.get(backend2.graph.version))
+        self.assertEqual(backend2.labels.build_cnt, 1)
+        print("  ✓ Graphs above the size limit are not labeled")
+
+    # ------------------------------------------------------------------------
+    # TEST 21: PATH RESULT CACHE
+    # ------------------------------------------------------------------------
+    def test_21_path_cache(self):
+        """Test that cached paths are reused and only the entries a change affects are dropped"""
+        print("\n[TEST 21] Testing path result cache...")
+        
+        cache = self.backend.cache
+        self.assertEqual(self.backend.get_best_path("Alice", "Charlie"), (8, ["Alice", "Bob", "Charlie"]))
+        self.assertEqual(self.backend.get_best_path("Charlie", "Alice"), (8, ["Charlie", "Bob", "Alice"]))
+        self.assertEqual(self.backend.get_best_path("Emily", "Grace"), (10, ["Emily", "Frank", "Grace"]))
+        self.assertEqual(self.backend.get_best_path("Ivan", "Kevin"), (5, ["Ivan", "Julia", "Kevin"]))
+        self.assertEqual((cache.hit_cnt, cache.miss_cnt), (1, 3))
+        print("  ✓ Both directions share one entry")
+        
+        self.backend.add_relation("Alice", "Emily", 20)
+        self.backend.add_relation("Bob", "Charlie", 1)
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertEqual(self.backend.get_best_path("Alice", "Charlie"), (6, ["Alice", "Bob", "Charlie"]))
+        self.backend.add_relation("Julia", "Kevin", 9)
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertEqual(self.backend.get_best_path("Ivan", "Kevin"), (11, ["Ivan", "Julia", "Kevin"]))
+        self.assertEqual(self.backend.get_best_path("Emily", "Grace"), (10, ["Emily", "Frank", "Grace"]))
+        self.assertEqual(cache.invalidation_cnt, 2)
+        print("  ✓ Only the entries a cheaper or more expensive relation affects are dropped")
+        
+        self.backend.set_limitation(9)
+        self.assertEqual(self.backend.get_best_path("Emily", "Grace"), (None, []))
+        self.assertEqual(cache.stats()['entries'], 4)
+        print("  ✓ Results are cached per limitation")
+        
+        # a search which would settle too many nodes flushes the cache instead
+        self.backend.CACHE_SEARCH_BUDGET = 1
+        self.backend.add_relation("Ivan", "Kevin", 1)
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(self.backend.get_best_path("Ivan", "Kevin"), (1, ["Ivan", "Kevin"]))
+        print("  ✓ The cache is flushed when the targeted invalidation would search too far")
+
+    # ------------------------------------------------------------------------
+    # TEST 22: ARRAY UNION-FIND
+    # ------------------------------------------------------------------------
+    def test_22_array_union_find(self):
+        """Test that the array union-find shares ids with the graph and agrees with UF_by_size"""
+        print("\n[TEST 22] Testing array union-find...")
+        
+        uf = self.backend.uf
+        self.assertIs(uf.names, self.backend.graph.names)
+        self.assertEqual(uf.set_size(uf.names.get_id("Alice")), 4)
+        self.assertEqual(uf.find("Nobody"), "Nobody")
+        self.assertFalse(uf.check_same_union("Nobody", "Alice"))
+        print("  ✓ Component sizes are kept with the shared name ids")
+        
+        import random
+        rng = random.Random(0)
+        edges = [(rng.randrange(200), rng.randrange(200)) for _ in range(150)]
+        old, new = UF_by_size(), UF_by_array()
+        for u, v in edges:
+            old.union(u, v)
+            new.names.intern(u)
+            new.names.intern(v)
+        new.union_many((new.names.get_id(u), new.names.get_id(v)) for u, v in edges)
+        for u, v in edges[:50]:
+            for w in range(20):
+                self.assertEqual(old.check_same_union(u, w), new.check_same_union(u, w))
+        self.assertEqual(sum(new.set_size(i) for i in range(len(new.names)) if new.find_id(i) == i), len(new.names))
+        print("  ✓ union_many builds the same components as UF_by_size")
+
+    # ------------------------------------------------------------------------
+    # TEST 23: REMOVE RELATIONS
+    # ------------------------------------------------------------------------
+    def test_23_remove_relation(self):
+        """Test that removing relations updates paths and splits components"""
+        print("\n[TEST 23] Testing relation removal...")
+        
+        self.assertEqual(self.backend.get_best_path("Alice", "Charlie"), (8, ["Alice", "Bob", "Charlie"]))
+        self.assertTrue(self.backend.remove_relation("Bob", "Alice"))
+        self.assertFalse(self.backend.remove_relation("Alice", "Bob"))
+        self.assertEqual(self.backend.get_best_path("Alice", "Charlie"), (12, ["Alice", "David", "Charlie"]))
+        self.assertTrue(self.backend.check_relation("Alice", "Bob"))
+        print("  ✓ Removed relation is not used anymore, the component stays whole")
+        
+        self.backend.remove_relation("David", "Charlie")
+        self.assertFalse(self.backend.check_relation("Alice", "Bob"))
+        self.assertTrue(self.backend.check_relation("Alice", "David"))
+        self.assertEqual(self.backend.get_best_path("Alice", "Charlie"), (None, None))
+        self.assertEqual(self.backend.uf.set_size(self.backend.graph.names.get_id("Bob")), 2)
+        print("  ✓ Component split in two")
+        
+        self.assertTrue(self.backend.remove_person("Julia"))
+        self.assertFalse(self.backend.graph.check_data("Julia"))
+        self.assertEqual(self.backend.get_best_path("Ivan", "Kevin"), (16, ["Ivan", "Laura", "Kevin"]))
+        self.backend.add_relation("Julia", "Mike", 1)
+        self.assertFalse(self.backend.check_relation("Julia", "Ivan"))
+        self.assertTrue(self.backend.check_relation("Julia", "Nancy"))
+        print("  ✓ Removed person leaves its component")
+
+    # ------------------------------------------------------------------------
+    # TEST 24: COMPONENT MEMBERS
+    # ------------------------------------------------------------------------
+    def test_24_component_members(self):
+        """Test that component member lists follow unions and splits"""
+        print("\n[TEST 24] Testing component members...")
+        
+        self.assertEqual(self.backend.get_component_count(), 6)
+        self.assertEqual(sorted(map(len, self.backend.get_connected_components())), [2, 4, 4, 4, 4, 4])
+        size, members, next_offset = self.backend.get_component("Alice", 0, 3)
+        self.assertEqual((size, len(members), next_offset), (4, 3, 3))
+        self.assertEqual(sorted(members + self.backend.get_component("Alice", 3, 3)[1]), ["Alice", "Bob", "Charlie", "David"])
+        self.assertIsNone(self.backend.get_component("Nobody"))
+        print("  ✓ Sizes and member pages without scanning the graph")
+        
+        self.backend.add_relation("Alice", "Mike", 1)
+        self.assertEqual(self.backend.get_component("Nancy")[0], 6)
+        self.backend.remove_relation("Alice", "Mike")
+        self.assertEqual(sorted(self.backend.get_component("Nancy")[1]), ["Mike", "Nancy"])
+        items, next_offset = self.backend.get_components_page(0, 4, 2)
+        self.assertEqual((len(items), next_offset), (4, 4))
+        self.assertTrue(all(len(members) == 2 for _, _, members in items))
+        self.assertEqual(sum(size for _, size, _ in items + self.backend.get_components_page(4, 4)[0]), 22)
+        print("  ✓ Member lists follow unions and splits")
+        
+        # Oliver breaks off, Peter and Quinn keep the old set
+        self.backend.remove_person("Rachel")
+        names, uf = self.backend.graph.names, self.backend.uf
+        self.backend.remove_relation("Oliver", "Peter")
+        self.assertEqual(sorted(self.backend.get_component("Quinn")[1]), ["Peter", "Quinn"])
+        self.assertEqual(uf.set_size(names.get_id("Oliver")), 1)
+        print("  ✓ Only the part which broke off gets a new set")
+
+    # ------------------------------------------------------------------------
+    # TEST 25: UPDATE RELATIONS
+    # ------------------------------------------------------------------------
+    def test_25_update_relation(self):
+        """Test that score updates reach paths, the cache and the landmarks"""
+        print("\n[TEST 25] Testing relation updates...")
+        
+        self.backend.landmarks.delay = 0
+        self.backend.set_landmarks(True)
+        events = []
+        self.backend.on_change(lambda changes, old_version: events.extend(changes))
+        self.assertEqual(self.backend.get_best_path("Alice", "Charlie"), (8, ["Alice", "Bob", "Charlie"]))
+        self.assertIsNone(self.backend.update_relation("Alice", "Charlie", 1))
+        self.assertEqual(self.backend.update_relation("Bob", "Charlie", 9), 3)
+        self.assertEqual(self.backend.get_best_path("Alice", "Charlie"), (12, ["Alice", "David", "Charlie"]))
+        self.assertEqual(len(events), 1)
+        print("  ✓ Only existing relations are updated, and paths follow the new score")
+        
+        self.backend.landmarks.join()
+        build_cnt = self.backend.landmarks.build_cnt
+        self.assertEqual(self.backend.update_relations([("Alice", "David", 10), ("Ivan", "Julia", 6)]), [10, 2])
+        self.assertEqual(len(events), 2)
+        self.assertIsNotNone(self.backend.landmarks.get(self.backend.graph.version), "Landmarks stay valid after an increase")
+        self.assertEqual(self.backend.compare_search_modes("Ivan", "Kevin")["alt"][0], 9)
+        self.assertEqual(self.backend.landmarks.build_cnt, build_cnt)
+        self.backend.update_relation("Ivan", "Julia", 1)
+        self.backend.landmarks.join()
+        self.assertEqual(self.backend.landmarks.build_cnt, build_cnt + 1, "A decrease needs new landmarks")
+        self.assertEqual(self.backend.get_best_path("Ivan", "Kevin"), (4, ["Ivan", "Julia", "Kevin"]))
+        print("  ✓ Landmarks are kept after increases and rebuilt after decreases")
+
+    # ------------------------------------------------------------------------
+    # TEST 26: SHARDED BACKEND
+    # ------------------------------------------------------------------------
+    def test_26_sharded_backend(self):
+        """Test that the sharded backend answers like Backend and moves components when they merge"""
+        print("\n[TEST 26] Testing sharded backend...")
+        
+        from Sharding import Sharded_Backend
+        sharded = Sharded_Backend(test_dir, 2)
+        try:
+            self.assertEqual(sorted(relations for _, _, relations in sharded.shard_stats()), [10, 13])
+            nodes = self.backend.get_all_nodes()
+            pairs = [(start, end) for start in nodes for end in nodes]
+            self.assertEqual(sharded.get_best_paths(pairs), [self.backend.get_best_path(*pair) for pair in pairs])
+            self.assertEqual(sharded.get_best_path("Alice", "Nobody"), (None, None))
+            print(f"  ✓ {len(pairs)} queries answered like Backend")
+            
+            shard_of = lambda fri: sharded.shard_of[sharded.uf.find_id(sharded.names.get_id(fri))]
+            alice, ivan = ("Alice", "Ivan") if shard_of("Alice") is not shard_of("Ivan") else ("Alice", "Emily")
+            self.assertIsNot(shard_of(alice), shard_of(ivan))
+            sharded.add_relation(alice, ivan, 1)
+            self.assertEqual(sharded.move_cnt, 1)
+            self.assertIs(shard_of(alice), shard_of(ivan))
+            self.backend.add_relation(alice, ivan, 1)
+            self.assertEqual(sharded.get_best_path("Charlie", "Kevin"), self.backend.get_best_path("Charlie", "Kevin"))
+            sharded.add_relation("Zed", "Yann", 2)
+            self.assertEqual(sharded.get_best_path("Yann", "Zed"), (2, ["Yann", "Zed"]))
+            self.assertEqual(sum(relations for _, _, relations in sharded.shard_stats()), 25)
+            print("  ✓ Merged components move to one shard")
+        finally:
+            sharded.close()
+
+    # ------------------------------------------------------------------------
+    # TEST 27: QUERY POOL
+    # ------------------------------------------------------------------------
+    def test_27_query_pool(self):
+        """Test that worker processes answer from the shared memory snapshot and see new relations"""
+        print("\n[TEST 27] Testing query pool...")
+        
+        nodes = self.backend.get_all_nodes()
+        pairs = [(start, end) for start in nodes for end in nodes]
+        expected = [result[0] for result in self.backend.get_best_paths(pairs)]
+        self.backend.set_query_pool(2)
+        try:
+            pool = self.backend.query_pool
+            self.assertEqual([result[0] for result in self.backend.get_best_paths(pairs)], expected)
+            self.assertEqual(pool.get_best_paths([("Alice", "Charlie")]), [(8, ["Alice", "Bob", "Charlie"])])
+            self.assertEqual(pool.generation, 1)
+            print(f"  ✓ {len(pairs)} batch queries answered by the workers")
+            
+            self.backend.add_relation("Charlie", "Ivan", 1)
+            self.assertEqual(pool.get_best_paths([("Alice", "Kevin")]), [(14, ["Alice", "Bob", "Charlie", "Ivan", "Julia", "Kevin"])])
+            self.assertEqual(pool.generation, 2)
+            self.assertEqual(len(pool.retired), 0, "The old snapshot should be unlinked")
+            self.assertEqual(pool.find_target("Alice", {"Kevin", "Zed"}), (14, ["Alice", "Bob", "Charlie", "Ivan", "Julia", "Kevin"]))
+            print("  ✓ A new snapshot is published after the relations changed")
+        finally:
+            self.backend.set_query_pool(0)
+
+    # ------------------------------------------------------------------------
+    # TEST 28: SNAPSHOT ISOLATION
+    # ------------------------------------------------------------------------
+    def test_28_snapshot_isolation(self):
+        """Test that a reader keeps the graph version it started with while relations change"""
+        print("\n[TEST 28] Testing snapshot isolation...")
+        
+        snapshot = self.backend.snapshot()
+        graph, uf = snapshot
+        reachable = self.backend.get_reachable("Alice", 0)
+        self.assertEqual(next(reachable), ("Bob", 5))
+        self.backend.add_relation("Alice", "Emily", 1)
+        self.backend.update_relation("Bob", "Charlie", 1)
+        self.backend.remove_relation("Alice", "David")
+        
+        self.assertEqual(graph.find_min_path("Alice", "Charlie"), (8, ["Alice", "Bob", "Charlie"]))
+        self.assertEqual(graph.find_min_path("Alice", "David"), (10, ["Alice", "David"]))
+        self.assertFalse(self.backend.check_relation("Alice", "Emily", snapshot))
+        self.assertEqual(sorted(name for name, _ in reachable), ["Charlie", "David"])
+        print("  ✓ Old snapshot and a running listing do not see the changes")
+        
+        self.assertTrue(self.backend.check_relation("Alice", "Emily"))
+        self.assertEqual(self.backend.get_best_path("Alice", "David"), (8, ["Alice", "Bob", "Charlie", "David"]))
+        self.assertEqual(self.backend.snapshot()[0].version, self.backend.graph.version)
+        print("  ✓ New readers see every change at once")
+
+    # ------------------------------------------------------------------------
+    # TEST 29: PER-QUERY LIMITATION
+    # ------------------------------------------------------------------------
+    def test_29_per_query_limit(self):
+        """Test that a query can bring its own limitation without changing the shared one"""
+        print("\n[TEST 29] Testing per-query limitation...")
+        
+        self.backend.add_relation("Charlie", "Ivan", 1)
+        self.backend.set_limitation(10)
+        self.assertEqual(self.backend.get_best_path("Alice", "Kevin"), (None, []))
+        self.assertEqual(self.backend.get_best_path("Alice", "Kevin", 20), (14, ["Alice", "Bob", "Charlie", "Ivan", "Julia", "Kevin"]))
+        self.assertEqual(self.backend.get_best_path("Alice", "Kevin", 0)[0], 14)
+        self.assertEqual(self.backend.get_best_path("Alice", "Charlie", 5), (None, []))
+        self.assertEqual(self.backend.get_best_paths([("Alice", "Kevin"), ("Alice", "Charlie")], 20),
+                         [(14, ["Alice", "Bob", "Charlie", "Ivan", "Julia", "Kevin"]), (8, ["Alice", "Bob", "Charlie"])])
+        self.assertEqual(self.backend.graph.weight_limitation, 10)
+        self.assertEqual(self.backend.get_best_path("Alice", "Kevin"), (None, []))
+        print("  ✓ Query limitation overrides the shared one only for that query")
+        
+        self.assertEqual(self.backend.find_target("Alice", "Kevin", 20)[0], 14)
+        self.assertEqual(self.backend.find_target("Alice", "Kevin"), (None, None))
+        graph = self.backend.graph
+        self.assertEqual(graph.Dijkstra("Alice", "Kevin", limit=20)[0], 14)
+        self.assertEqual(graph.Dijkstra("Alice", "Kevin"), (None, None))
+        self.backend.set_limitation(0)
+        self.assertEqual(graph.weight_limitation, float('inf'))
+        print("  ✓ find_target and Dijkstra take the limitation too, 0 is unlimited")
+
+    # ------------------------------------------------------------------------
+    # TEST 30: SOURCE TREE CACHE
+    # ------------------------------------------------------------------------
+    def test_30_source_tree_cache(self):
+        """Test that hot sources get a shortest path tree which answers any target and follows the changes"""
+        print("\n[TEST 30] Testing source tree cache...")
+        
+        trees = self.backend.trees
+        trees.min_uses = 2
+        self.backend.get_best_path("Alice", "Bob")
+        self.backend.get_best_path("Alice", "Charlie")
+        trees.join()
+        self.assertIn(("Alice", float('inf')), trees.trees)
+        hits = trees.hit_cnt
+        self.backend.cache.clear()
+        self.assertEqual(self.backend.get_best_path("Charlie", "Alice"), (8, ["Charlie", "Bob", "Alice"]))
+        self.assertEqual(self.backend.find_target("Alice", "Kevin"), (None, None)) # other component
+        self.assertEqual(trees.hit_cnt, hits + 2)
+        print("  ✓ Tree of a hot source answers other targets and find_target")
+        
+        self.backend.add_relation("Alice", "Charlie", 1)
+        trees.join()
+        self.assertEqual(self.backend.get_best_path("Alice", "Charlie"), (1, ["Alice", "Charlie"]))
+        self.assertEqual(trees.trees[("Alice", float('inf'))].version, self.backend.graph.version)
+        print("  ✓ Trees are rebuilt in the background after a change")
+        
+        # Alice was the source of 4 queries
+        trees.max_nodes = len(trees.trees[("Alice", float('inf'))])
+        for _ in range(4):
+            self.backend.get_best_path("Bob", "David")
+            self.backend.cache.clear()
+        trees.join()
+        self.assertEqual(list(trees.trees), [("Alice", float('inf'))])
+        self.backend.get_best_path("Bob", "David")
+        trees.join()
+        self.assertEqual(list(trees.trees), [("Bob", float('inf'))])
+        self.assertEqual(trees.eviction_cnt, 1)
+        print("  ✓ Under the node cap a source only replaces less used ones")
+        
+        # Emily's component has 4 people, so her tree is built once and never asked for again
+        trees.max_nodes = 3
+        builds = trees.build_cnt
+        for _ in range(10):
+            self.assertEqual(self.backend.get_best_path("Emily", "Grace"), (10, ["Emily", "Frank", "Grace"]))
+            self.backend.cache.clear()
+            trees.join()
+        self.assertEqual(trees.build_cnt, builds + 1)
+        self.assertNotIn(("Emily", float('inf')), trees.trees)
+        self.assertEqual(trees.stats()['rejected'], 1)
+        print("  ✓ A tree which cannot fit is not built again")
+
+    # ------------------------------------------------------------------------
+    # TEST 31: PERSONA KEYWORD INDEX
+    # ------------------------------------------------------------------------
+    def test_31_keyword_index(self):
+        """Test that the keyword index finds the same people as a substring scan of every summary"""
+        print("\n[TEST 31] Testing persona keyword index...")
+        
+        for keyword in ("engineer", "Engineer", "student", "in t", "s, ", "e", " ", "no such keyword"):
+            expected = {name for name, persona in get_all_personas().items() if keyword in persona.get("summary", "")}
+            self.assertEqual(find_personas(keyword), expected, keyword)
+        self.assertTrue(find_personas("Super Connector", ("title",)) >= {"Alice"})
+        print("  ✓ Same matches as testing every summary")
+        
+        self.backend.add_relation("Charlie", "Ivan", 1)
+        self.assertEqual(self.backend.find_target("Alice", "Kevin"), (14, ["Alice", "Bob", "Charlie", "Ivan", "Julia", "Kevin"]))
+        self.assertEqual(self.backend.find_target("Alice", "no such keyword"), (None, None))
+        graph = self.backend.graph
+        self.assertEqual(graph.find_nearest("Alice", {"Kevin", "Julia"}), graph.Dijkstra("Alice", "Julia"))
+        self.assertEqual(graph.find_nearest("Nobody", {"Nobody"}), (0, ["Nobody"]))
+        print("  ✓ find_target searches for the matching people only")
+
+    # ------------------------------------------------------------------------
+    # TEST 32: K CLOSEST MATCHING PEOPLE
+    # ------------------------------------------------------------------------
+    def test_32_find_targets(self):
+        """Test the k closest matching people with the forward and the reverse search"""
+        print("\n[TEST 32] Testing k closest matching people...")
+        
+        self.backend.find_personas = lambda keyword: frozenset({"Bob", "Charlie", "David", "Kevin"})
+        for few_matches in (16, 0): # reverse search from the matches, then one search from Alice
+            self.backend.FEW_MATCHES = few_matches
+            self.assertEqual(self.backend.find_targets("Alice", "any", 2), [(5, ["Alice", "Bob"]), (8, ["Alice", "Bob", "Charlie"])])
+            self.assertEqual([dist for dist, _ in self.backend.find_targets("Alice", "any", 10)], [5, 8, 10])
+            self.assertEqual(self.backend.find_targets("Alice", "any", 3, 6), [(5, ["Alice", "Bob"])])
+            self.assertEqual(self.backend.find_targets("Bob", "any", 1), [(0, ["Bob"])])
+        print("  ✓ Same k closest matches from both search directions, other components left out")
+        
+        self.backend.find_personas = lambda keyword: frozenset()
+        self.assertEqual(self.backend.find_targets("Alice", "any", 3), [])
+        self.assertEqual(self.backend.find_target("Alice", "any"), (None, None))
+        print("  ✓ No match gives no result")
+
+    # ------------------------------------------------------------------------
+    # TEST 33: SQLITE PERSONA STORE
+    # ------------------------------------------------------------------------
+    def test_33_sqlite_persona_store(self):
+        """Test that the converted SQLite store reads the same personas lazily with a bounded cache"""
+        print("\n[TEST 33] Testing SQLite persona store...")
+        
+        personas = get_all_personas()
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "personas.db"
+            self.assertEqual(convert_to_sqlite(DATA_FILE, db_path), len(personas))
+            store = SQLite_Persona_Store(db_path, cache_size=2)
+            try:
+                self.assertEqual(store.names(), list(personas))
+                self.assertEqual(len(store.cache), 0)
+                for name in list(personas)[:3]:
+                    self.assertEqual(store.get(name), personas[name])
+                self.assertEqual(list(store.cache), list(personas)[1:3])
+                self.assertIsNone(store.get("Nobody"))
+                self.assertEqual(dict(store.items()), personas)
+                print("  ✓ Profiles are decoded on demand, at most cache_size are kept")
+                
+                memory = Dict_Persona_Store(personas)
+                for keyword in ("engineer", "in t", "Connector", " ", "no such keyword"):
+                    for fields in (("summary",), ("title", "goals")):
+                        self.assertEqual(store.find(keyword, fields), memory.find(keyword, fields), keyword)
+                print("  ✓ Keyword search of the stored index matches the in-memory one")
+            finally:
+                store.close()
+
+    # ------------------------------------------------------------------------
+    # TEST 34: PERSONA PAGES
+    # ------------------------------------------------------------------------
+    def test_34_persona_pages(self):
+        """Test persona paging, field projection and the tooltip view"""
+        print("\n[TEST 34] Testing persona pages...")
+        
+        personas = get_all_personas()
+        pages, offset = [], 0
+        while offset is not None:
+            page, offset = get_personas_page(offset, 5)
+            self.assertLessEqual(len(page), 5)
+            pages.append(page)
+        self.assertEqual(len(pages), (len(personas) + 4) // 5)
+        self.assertEqual({name: persona for page in pages for name, persona in page.items()}, personas)
+        print("  ✓ Pages cover every persona once")
+        
+        page, _ = get_personas_page(0, 3, ["id", "age", "no_such_field"])
+        self.assertEqual(page, {name: {"id": persona["id"], "age": persona["age"]} for name, persona in list(personas.items())[:3]})
+        page, _ = get_personas_page(0, 1, view="tooltip")
+        (name, tooltip), = page.items()
+        self.assertEqual(set(tooltip), {"id", "full_name", "title", "age", "summary"})
+        self.assertTrue(personas[name]["summary"].startswith(tooltip["summary"].rstrip(".")))
+        self.assertLessEqual(len(tooltip["summary"]), 143)
+        print("  ✓ Field projection and tooltip view")
+        
+        names = list(personas)[:2]
+        tooltips = get_personas(names + ["Nobody", names[0]], view="tooltip")
+        self.assertEqual(list(tooltips), names)
+        self.assertEqual(tooltips[names[0]], get_personas_page(0, 1, view="tooltip")[0][names[0]])
+        self.assertEqual(get_personas(names[:1], ["age"]), {names[0]: {"age": personas[names[0]]["age"]}})
+        print("  ✓ Tooltips of only the requested names")
+
+    # ------------------------------------------------------------------------
+    # TEST 35: NAME SUGGESTIONS
+    # ------------------------------------------------------------------------
+    def test_35_name_suggestions(self):
+        """Test prefix and fuzzy name suggestions, and that new people are suggested at once"""
+        print("\n[TEST 35] Testing name suggestions...")
+        
+        index = Prefix_Index(["Alice", "alan", "Bob", "Charlie", "Charles", "Alice"])
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.suggest("AL"), (["alan", "Alice"], False))
+        self.assertEqual(index.suggest("char", 1), (["Charles"], False))
+        self.assertEqual(index.suggest("Chalr"), (["Charles", "Charlie"], True))
+        self.assertEqual(index.suggest("xyz"), ([], True))
+        self.assertEqual(fuzzy_prefix_distance("kevn", "kevin", 2), 1)
+        self.assertEqual(fuzzy_prefix_distance("abc", "xyz", 1), 2)
+        print("  ✓ Prefix matches first, bounded edit distance otherwise")
+        
+        self.assertEqual(self.backend.suggest_names("kev"), (["Kevin"], False))
+        self.assertEqual(self.backend.suggest_names("Kevn"), (["Kevin"], True))
+        self.assertEqual(self.backend.suggest_names("zo"), ([], True))
+        self.backend.add_relation("Alice", "Zoe", 2)
+        self.assertEqual(self.backend.suggest_names("zo"), (["Zoe"], False))
+        print("  ✓ add_relation keeps the suggestions in sync")
+
+    # ------------------------------------------------------------------------
+    # TEST 36: ASGI APP
+    # ------------------------------------------------------------------------
+    def test_36_asgi_app(self):
+        """Test that the ASGI app picks the executor of each route and answers like the Flask app"""
+        print("\n[TEST 36] Testing ASGI app...")
+        
+        try:
+            import asgi_app
+        except ImportError as exc:
+            self.skipTest(f"the Flask app cannot be imported: {exc}")
+        
+        self.assertIs(asgi_app.executor_for('/api/find_path'), asgi_app.search_executor)
+        self.assertIs(asgi_app.executor_for('/api/components'), asgi_app.graph_executor)
+        self.assertIsNone(asgi_app.executor_for('/static/app.js'))
+        self.assertIsNone(asgi_app.executor_for('/api/persona/Alice'))
+        print("  ✓ Searches, graph requests and small getters run on their own executors")
+        
+        # drive the app with a hand-built scope, the body is sent in the given chunks
+        def call(method, path, chunks = (b'',)):
+            messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                        for i, chunk in enumerate(chunks)]
+            sent = []
+            async def receive():
+                return messages.pop(0)
+            async def send(message):
+                sent.append(message)
+            scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+                     'headers': [(b'content-type', b'application/json')]}
+            asyncio.run(asgi_app.app(scope, receive, send))
+            self.assertEqual(sent[0]['type'], 'http.response.start')
+            self.assertFalse(messages, "The whole body should be read")
+            return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+        
+        client = asgi_app.wsgi_app.test_client()
+        status, body = call('GET', '/api/components')
+        expected = client.get('/api/components')
+        self.assertEqual((status, body), (expected.status_code, expected.data))
+        print("  ✓ Same status and body as the Flask test client")
+        
+        from flask_app import backend
+        person1, person2 = sorted(backend.get_all_nodes())[:2]
+        payload = json.dumps({'person1': person1, 'person2': person2}).encode()
+        expected = client.post('/api/find_path', json={'person1': person1, 'person2': person2})
+        for chunks in ([payload], [payload[:5], payload[5:9], b'', payload[9:]]):
+            self.assertEqual(call('POST', '/api/find_path', chunks), (expected.status_code, expected.data))
+        print("  ✓ A body sent in several more_body messages is put back together")
 
 
 # ============================================================================
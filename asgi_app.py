@@ -0,0 +1,122 @@
+import asyncio
+import contextvars
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from flask_app import app as wsgi_app
+
+# ASGI entry point serving the same routes as flask_app.py, e.g.  uvicorn asgi_app:app
+    # every request runs the Flask view, only the place it runs on differs:
+    # - static pages, persona lookups and the small getters run on the event loop
+    # - path searches run in a bounded thread pool (ASGI_SEARCH_THREADS)
+    # - the other graph requests (graph data, components, writes) run in their own pool (ASGI_GRAPH_THREADS),
+    #   so slow searches filling the search pool never hold back a graph-data fetch
+    # at most ASGI_MAX_REQUESTS requests are handled at once, the rest wait for a free slot
+
+SEARCH_ROUTES = {'/api/find_path', '/api/find_paths', '/api/find_path_batch', '/api/find_target', '/api/reachable'}
+LOOP_ROUTES = {'/', '/api/personas', '/api/get_limitation', '/api/cache_stats'}
+LOOP_PREFIXES = ('/static/', '/profile/', '/api/persona/')
+
+search_executor = ThreadPoolExecutor(int(os.environ.get('ASGI_SEARCH_THREADS', 4)), thread_name_prefix='asgi-search')
+graph_executor = ThreadPoolExecutor(int(os.environ.get('ASGI_GRAPH_THREADS', 2)), thread_name_prefix='asgi-graph')
+request_slots = asyncio.Semaphore(int(os.environ.get('ASGI_MAX_REQUESTS', 64)))
+
+# None - run on the event loop
+def executor_for(path):
+    if path in SEARCH_ROUTES:
+        return search_executor
+    if path in LOOP_ROUTES or path.startswith(LOOP_PREFIXES):
+        return None
+    return graph_executor
+
+async def read_body(receive):
+    body = BytesIO()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            return body.getvalue()
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name != 'CONTENT_TYPE':
+            name = 'HTTP_' + name
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+# run the Flask app for one request, chunks of a streamed response are produced on the same executor
+    # every step runs in one context of its own, since the steps may run on different threads
+async def handle_http(scope, receive, send):
+    if (body := await read_body(receive)) is None:
+        return
+    environ = build_environ(scope, body)
+    executor = executor_for(scope['path'])
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+
+    async def run(fn, *args):
+        if executor is None:
+            return context.run(fn, *args)
+        return await loop.run_in_executor(executor, context.run, fn, *args)
+
+    response = {}
+    def start_response(status, headers, exc_info = None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+    async with request_slots:
+        result = await run(wsgi_app, environ, start_response)
+        try:
+            await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+            chunks = iter(result)
+            while (chunk := await run(next, chunks, None)) is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await run(result.close)
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            search_executor.shutdown()
+            graph_executor.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'http':
+        await handle_http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
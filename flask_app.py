@@ -1,8 +1,9 @@
-from flask import Flask, jsonify, request, render_template_string
+from flask import Flask, Response, jsonify, request, render_template_string, stream_with_context
 from flask_cors import CORS
 from Backend import Backend
-from persona_data import get_all_personas, get_persona
+from persona_data import get_persona, get_personas, get_personas_page, persona_count, persona_version
 import os
+import json
 import atexit
 
 app = Flask(__name__)
@@ -39,6 +40,23 @@ except Exception as e:
     backend.init_space()
 atexit.register(lambda : backend.when_exit())
 
+# cross-check path queries with a plain Dijkstra in the background: "off", "sampled" or "always"
+backend.set_verification(os.environ.get('PATH_VERIFY_MODE', 'sampled'),
+                         float(os.environ.get('PATH_VERIFY_PERCENT', 1)))
+
+# run the searches in QUERY_POOL_WORKERS worker processes (0 - in the server process)
+    # workers are forked, since a spawned worker would import this module and load another backend
+backend.set_query_pool(int(os.environ.get('QUERY_POOL_WORKERS', 0)), "fork")
+
+# HUB_LABELS=1 builds the hub label index (only for graphs up to Backend.HUB_LABEL_MAX_NODES people)
+backend.set_hub_labels(bool(int(os.environ.get('HUB_LABELS', 0))))
+
+# CONTRACTION_HIERARCHY=1 builds the contraction hierarchy index
+backend.set_contraction_hierarchy(bool(int(os.environ.get('CONTRACTION_HIERARCHY', 0))))
+
+# LANDMARKS=1 builds the landmarks for the ALT search (slower than the plain search on social graphs)
+backend.set_landmarks(bool(int(os.environ.get('LANDMARKS', 0))))
+
 # HTML template will be served from here
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -174,6 +192,8 @@ HTML_TEMPLATE = '''
         </div>
     </div>
 
+    <datalist id="nameSuggestions"></datalist>
+
     <div id="personaTooltip" class="persona-tooltip hidden">
         <div class="tooltip-name" id="tooltipName"></div>
         <div class="tooltip-role" id="tooltipTitle"></div>
@@ -192,7 +212,9 @@ HTML_TEMPLATE = '''
         let personaPreviewElements = {};
         let currentPersonaId = null;
         let personaCache = {};
-        let personaCacheLoading = null;
+        let personaTooltipCache = {};
+        let personaTooltipPending = new Map();
+        let personaTooltipTimer = null;
         let personaTooltipElements = {};
         let tooltipHideTimeout = null;
         const defaultPathMessage = `
@@ -249,44 +271,67 @@ HTML_TEMPLATE = '''
             }
         }
 
-        async function preloadPersonas() {
-            if (personaCacheLoading) {
-                return personaCacheLoading;
-            }
+        // Fetch the compact tooltip view of hovered names only; names hovered within a short window share one
+        // request, and every answer stays in personaTooltipCache. Full profiles are fetched when opened.
+        function requestPersonaTooltip(name) {
+            return new Promise((resolve, reject) => {
+                if (!personaTooltipPending.has(name)) {
+                    personaTooltipPending.set(name, []);
+                }
+                personaTooltipPending.get(name).push({ resolve, reject });
+                if (!personaTooltipTimer) {
+                    personaTooltipTimer = setTimeout(flushPersonaTooltips, 30);
+                }
+            });
+        }
 
-            personaCacheLoading = (async () => {
-                const response = await fetch('/api/personas');
+        async function flushPersonaTooltips() {
+            const batch = personaTooltipPending;
+            personaTooltipPending = new Map();
+            personaTooltipTimer = null;
+            const params = new URLSearchParams({ view: 'tooltip' });
+            batch.forEach((_, name) => params.append('names', name));
+            try {
+                const response = await fetch(`/api/personas?${params}`);
                 const data = await response.json();
                 if (!response.ok || !data.success || !data.personas) {
                     throw new Error(data.message || 'Unable to load personas');
                 }
-                personaCache = data.personas || {};
-                return personaCache;
-            })();
-
-            try {
-                return await personaCacheLoading;
+                Object.assign(personaTooltipCache, data.personas);
+                batch.forEach((waiters, name) => waiters.forEach(waiter => waiter.resolve(data.personas[name] || null)));
             } catch (error) {
-                console.warn('Persona preload failed:', error);
-                personaCacheLoading = null;
-                throw error;
+                console.warn('Persona tooltip request failed:', error);
+                batch.forEach(waiters => waiters.forEach(waiter => waiter.reject(error)));
             }
         }
 
-        async function getPersonaData(name) {
+        async function getPersonaTooltip(name) {
             if (!name) {
                 throw new Error('Invalid name');
             }
+            if (personaTooltipCache[name]) {
+                return personaTooltipCache[name];
+            }
             if (personaCache[name]) {
                 return personaCache[name];
             }
             try {
-                const personas = await preloadPersonas();
-                if (personas[name]) {
-                    return personas[name];
+                const tooltip = await requestPersonaTooltip(name);
+                if (tooltip) {
+                    return tooltip;
                 }
             } catch (error) {
-                // If preload fails, fall back to single fetch below.
+                // If the tooltip request fails, fall back to the full profile below.
+            }
+            return getPersonaData(name);
+        }
+
+        async function getPersonaData(name) {
+            if (!name) {
+                throw new Error('Invalid name');
+            }
+            if (personaCache[name]) {
+                return personaCache[name];
             }
             const response = await fetch(`/api/persona/${encodeURIComponent(name)}`);
             const data = await response.json();
@@ -435,7 +480,7 @@ HTML_TEMPLATE = '''
             if (!name) return;
             showPersonaTooltipLoading(name, event);
             try {
-                const persona = await getPersonaData(name);
+                const persona = await getPersonaTooltip(name);
                 renderPersonaTooltip(persona, event);
             } catch (error) {
                 showPersonaTooltipError(name, error, event);
@@ -1092,11 +1137,44 @@ HTML_TEMPLATE = '''
         function refreshGraph() {
             loadGraph();
         }
+
+        // Autocomplete the name fields from /api/suggest while typing
+        function setupNameSuggestions() {
+            const datalist = document.getElementById('nameSuggestions');
+            let suggestTimeout = null;
+            nameInputIds.forEach(id => {
+                const input = document.getElementById(id);
+                if (!input) return;
+                input.setAttribute('list', 'nameSuggestions');
+                input.setAttribute('autocomplete', 'off');
+                input.addEventListener('input', () => {
+                    clearTimeout(suggestTimeout);
+                    const query = input.value.trim();
+                    if (!query) return;
+                    suggestTimeout = setTimeout(async () => {
+                        try {
+                            const response = await fetch(`/api/suggest?q=${encodeURIComponent(query)}`);
+                            const data = await response.json();
+                            if (!data.success || input.value.trim() !== query) return;
+                            datalist.innerHTML = '';
+                            data.suggestions.forEach(name => {
+                                const option = document.createElement('option');
+                                option.value = name;
+                                datalist.appendChild(option);
+                            });
+                        } catch (error) {
+                            console.warn('Name suggestions failed:', error);
+                        }
+                    }, 150);
+                });
+            });
+        }
         
         // Initialize on load
         window.addEventListener('load', () => {
             initGraph();
             setupInputFocusTracking();
+            setupNameSuggestions();
             initPersonaPreview();
             initPersonaTooltip();
             showPersonaPlaceholder("Select a node to preview this friend's profile.");
@@ -1216,17 +1294,54 @@ def profile_page(person_id):
 
 @app.route('/api/personas')
 def personas_api():
-    """Return the full persona dataset backed by the JSON file."""
-    personas = get_all_personas() or {}
-    if not personas:
+    """Return one page of personas (?cursor=&page_size=&fields=id,title,age&view=tooltip).
+
+    view=tooltip gives the compact tooltip view instead of the full profile, and fields keeps
+    only the listed keys. next_cursor is null on the last page; a cursor only works for the
+    persona version it came from. ?names=A&names=B returns only those personas, without paging.
+    """
+    count = persona_count()
+    if not count:
         return jsonify({
             'success': False,
             'message': 'No persona data available'
         }), 404
+    view = request.args.get('view', 'full')
+    if view not in ('full', 'tooltip'):
+        return jsonify({'success': False, 'message': 'view must be full or tooltip'}), 400
+    fields = request.args.get('fields')
+    fields = [field for field in fields.split(',') if field] if fields else None
+    version = persona_version()
+    if names := request.args.getlist('names'):
+        if len(names) > 1000:
+            return jsonify({'success': False, 'message': 'At most 1000 names per request'}), 400
+        return jsonify({
+            'success': True,
+            'count': count,
+            'version': version,
+            'personas': get_personas(names, fields, view),
+            'next_cursor': None
+        })
+    try:
+        page_size = int(request.args.get('page_size', 100))
+        offset = 0
+        if cursor := request.args.get('cursor'):
+            cursor_version, offset = cursor.rsplit('.', 1)
+            offset = int(offset)
+            if cursor_version != version[:12] or offset < 0:
+                return jsonify({'success': False, 'message': 'Cursor is invalid or the personas changed, start again'}), 400
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid cursor or page_size'}), 400
+    if not 1 <= page_size <= 1000:
+        return jsonify({'success': False, 'message': 'page_size must be between 1 and 1000'}), 400
+    
+    personas, next_offset = get_personas_page(offset, page_size, fields, view)
     return jsonify({
         'success': True,
-        'count': len(personas),
-        'personas': personas
+        'count': count,
+        'version': version,
+        'personas': personas,
+        'next_cursor': None if next_offset is None else f'{version[:12]}.{next_offset}'
     })
 
 
@@ -1244,6 +1359,29 @@ def persona_api(person_id):
         'persona': persona
     })
 
+MAX_SUGGESTIONS = 50
+
+@app.route('/api/suggest')
+def suggest():
+    """Suggest names starting with ?q= (case-insensitive), or close misspellings if none does"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'message': 'q is required'})
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'limit must be an integer'})
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        return jsonify({'success': False, 'message': f'limit must be between 1 and {MAX_SUGGESTIONS}'})
+    
+    suggestions, fuzzy = backend.suggest_names(query, limit)
+    return jsonify({
+        'success': True,
+        'query': query,
+        'suggestions': suggestions,
+        'fuzzy': fuzzy
+    })
+
 @app.route('/api/graph_data')
 def get_graph_data():
     """Get complete graph data for visualization"""
@@ -1285,71 +1423,207 @@ def get_limitation():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
-@app.route('/api/find_path', methods=['POST'])
-def find_path():
-    """Find shortest path between two people"""
-    data = request.json
-    person1 = data.get('person1')
-    person2 = data.get('person2')
-    
-    if not person1 or not person2:
-        return jsonify({'success': False, 'message': 'Both names are required'})
-    
-    score, path = backend.get_best_path(person1, person2)
-    
-    # Handle the three different return cases
+@app.route('/api/cache_stats')
+def cache_stats():
+    """Get the shortest path result cache and source tree cache counters"""
+    return jsonify({'success': True, 'cache': backend.cache.stats(), 'trees': backend.trees.stats()})
+
+def query_limit(data):
+    """Read the limit of one query from ?limit= or the JSON body
+
+    Returns None when it is left out (the current limitation is used), 0 is unlimited.
+    Raises ValueError if it is not an integer between 0 and 100.
+    """
+    limit = request.args.get('limit', data.get('limit'))
+    if limit is None:
+        return None
+    limit = int(limit)
+    if limit < 0 or limit > 100:
+        raise ValueError('limit must be between 0 and 100')
+    return limit
+
+def path_result(person1, person2, score, path, limit = None):
+    """Turn one of the three get_best_path results into the response of /api/find_path"""
     if score is None and path == []:
         # Connection exists but exceeds limitation
-        current_limit = backend.graph.weight_limitation
-        if current_limit == float('inf'):
+        current_limit = backend.graph.weight_limitation if limit is None else limit
+        if current_limit in (0, float('inf')):
             current_limit = "unlimited"
-        return jsonify({
+        return {
             'success': False,
             'reason': 'exceeds_limit',
             'message': f'Connection exists between {person1} and {person2}, but the shortest path exceeds the current limit of {current_limit}'
-        })
+        }
     elif score is None and path is None:
         # No connection at all
-        return jsonify({
+        return {
             'success': False,
             'reason': 'no_connection',
             'message': f'No connection found between {person1} and {person2} - they are in different network components'
-        })
+        }
     
-    return jsonify({
+    return {
         'success': True,
         'score': score,
         'path': path
+    }
+
+@app.route('/api/find_path', methods=['POST'])
+def find_path():
+    """Find shortest path between two people"""
+    data = request.json
+    person1 = data.get('person1')
+    person2 = data.get('person2')
+    
+    if not person1 or not person2:
+        return jsonify({'success': False, 'message': 'Both names are required'})
+    try:
+        limit = query_limit(data)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'limit must be an integer between 0 and 100'})
+    
+    score, path = backend.get_best_path(person1, person2, limit)
+    return jsonify(path_result(person1, person2, score, path, limit))
+
+MAX_PATHS = 20
+
+@app.route('/api/find_paths', methods=['POST'])
+def find_paths():
+    """Find the k shortest alternative paths between two people (k from ?k=, default 5)"""
+    data = request.json
+    person1 = data.get('person1')
+    person2 = data.get('person2')
+    
+    if not person1 or not person2:
+        return jsonify({'success': False, 'message': 'Both names are required'})
+    try:
+        k = int(request.args.get('k', data.get('k', 5)))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'k must be an integer'})
+    if not 1 <= k <= MAX_PATHS:
+        return jsonify({'success': False, 'message': f'k must be between 1 and {MAX_PATHS}'})
+    try:
+        limit = query_limit(data)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'limit must be an integer between 0 and 100'})
+    
+    paths = backend.get_k_best_paths(person1, person2, k, limit)
+    if not paths:
+        # same failure reasons as /api/find_path
+        return jsonify(path_result(person1, person2, None, paths, limit))
+    return jsonify({
+        'success': True,
+        'paths': [{'score': score, 'path': path} for score, path in paths]
+    })
+
+MAX_BATCH_PAIRS = 10000
+
+@app.route('/api/find_path_batch', methods=['POST'])
+def find_path_batch():
+    """Find shortest paths for many pairs at once, queries sharing a person share one search"""
+    data = request.json
+    pairs = data.get('pairs')
+    
+    if not isinstance(pairs, list) or not pairs:
+        return jsonify({'success': False, 'message': 'pairs must be a non-empty list of [person1, person2]'})
+    if len(pairs) > MAX_BATCH_PAIRS:
+        return jsonify({'success': False, 'message': f'At most {MAX_BATCH_PAIRS} pairs per request'})
+    if not all(isinstance(pair, list) and len(pair) == 2 and all(pair) for pair in pairs):
+        return jsonify({'success': False, 'message': 'Every pair needs two names'})
+    try:
+        limit = query_limit(data)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'limit must be an integer between 0 and 100'})
+    
+    results = backend.get_best_paths([tuple(pair) for pair in pairs], limit)
+    return jsonify({
+        'success': True,
+        'results': [path_result(person1, person2, score, path, limit)
+                    for (person1, person2), (score, path) in zip(pairs, results)]
     })
 
+MAX_TARGETS = 20
+
 @app.route('/api/find_target', methods=['POST'])
 def find_target():
-    """Find a person whose profile contains a specific keyword"""
+    """Find the closest people whose profile contains a specific keyword (k from ?k=, default 1)"""
     data = request.json
     start = data.get('start')
     target = data.get('target')
     
     if not start or not target:
         return jsonify({'success': False, 'message': 'Both starting person and target keyword are required'})
+    try:
+        limit = query_limit(data)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'limit must be an integer between 0 and 100'})
+    try:
+        k = int(request.args.get('k', data.get('k', 1)))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'k must be an integer'})
+    if not 1 <= k <= MAX_TARGETS:
+        return jsonify({'success': False, 'message': f'k must be between 1 and {MAX_TARGETS}'})
     
     try:
-        found_person, path = backend.find_target(start, target)
+        found = backend.find_targets(start, target, k, limit)
         
-        if found_person is None:
+        if not found:
             return jsonify({
                 'success': False,
                 'message': f'No person found with "{target}" in their profile from {start}'
             })
         
+        # the closest match is also returned on its own, as before k existed
+        score, path = found[0]
+        found_person = path[-1]
         return jsonify({
             'success': True,
             'found_person': found_person,
+            'score': score,
             'path': path,
+            'matches': [{'person': path[-1], 'score': score, 'path': path} for score, path in found],
             'message': f'Found {found_person} with matching profile'
         })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/reachable', methods=['POST'])
+def reachable():
+    """List everyone reachable from a person within a score limit, closest first
+
+    Returns one page (offset / page_size), or every result as JSON lines when stream is true.
+    """
+    data = request.json
+    person = data.get('person')
+    
+    if not person:
+        return jsonify({'success': False, 'message': 'Name is required'})
+    
+    try:
+        # missing limit uses the current limitation, 0 is unlimited
+        limit = data.get('limit')
+        limit = None if limit is None else int(limit)
+        offset = int(data.get('offset', 0))
+        page_size = int(data.get('page_size', 100))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'limit, offset and page_size must be integers'})
+    if offset < 0 or not 1 <= page_size <= 1000:
+        return jsonify({'success': False, 'message': 'offset must be >= 0 and page_size between 1 and 1000'})
+    
+    if data.get('stream'):
+        def generate():
+            for name, score in backend.get_reachable(person, limit):
+                yield json.dumps({'person': name, 'score': score}) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    items, next_offset = backend.get_reachable_page(person, limit, offset, page_size)
+    return jsonify({
+        'success': True,
+        'reachable': [{'person': name, 'score': score} for name, score in items],
+        'offset': offset,
+        'next_offset': next_offset
+    })
+
 @app.route('/api/add_relation', methods=['POST'])
 def add_relation():
     """Add a new relationship"""
@@ -1374,6 +1648,61 @@ def add_relation():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/update_relations', methods=['POST'])
+def update_relations():
+    """Change the scores of existing relationships, given as a list of {friend1, friend2, score}"""
+    data = request.json
+    updates = data.get('updates')
+    
+    if not isinstance(updates, list) or not updates:
+        return jsonify({'success': False, 'message': 'updates must be a non-empty list'})
+    if len(updates) > MAX_BATCH_PAIRS:
+        return jsonify({'success': False, 'message': f'At most {MAX_BATCH_PAIRS} updates per request'})
+    
+    try:
+        changes = [(item['friend1'], item['friend2'], int(item['score'])) for item in updates]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Every update needs friend1, friend2 and an integer score'})
+    if any(score < 1 or score > 10 for _, _, score in changes):
+        return jsonify({'success': False, 'message': 'Score must be between 1 and 10'})
+    
+    old_scores = backend.update_relations(changes)
+    return jsonify({
+        'success': True,
+        'results': [{
+            'friend1': friend1,
+            'friend2': friend2,
+            'score': score,
+            'old_score': old_score,
+            'updated': old_score is not None
+        } for (friend1, friend2, score), old_score in zip(changes, old_scores)]
+    })
+
+@app.route('/api/remove_relation', methods=['POST'])
+def remove_relation():
+    """Remove a relationship, or every relationship of a person if only friend1 is given"""
+    data = request.json
+    friend1 = data.get('friend1')
+    friend2 = data.get('friend2')
+    
+    if not friend1:
+        return jsonify({'success': False, 'message': 'friend1 is required'})
+    
+    try:
+        if not friend2:
+            if not backend.remove_person(friend1):
+                return jsonify({'success': False, 'message': f'{friend1} has no relationships'})
+            return jsonify({'success': True, 'message': f'All relationships of {friend1} removed'})
+        if not backend.remove_relation(friend1, friend2):
+            return jsonify({'success': False, 'message': f'{friend1} and {friend2} are not friends'})
+        return jsonify({
+            'success': True,
+            'message': 'Relationship removed successfully',
+            'still_connected': backend.check_relation(friend1, friend2)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
 @app.route('/api/check_relation', methods=['POST'])
 def check_relation():
     """Check if two people are connected"""
@@ -1392,12 +1721,46 @@ def check_relation():
 
 @app.route('/api/components')
 def get_components():
-    """Get all connected components"""
-    components = backend.get_connected_components()
+    """Get one page of the connected components (?offset=&page_size=&member_limit=)"""
+    try:
+        offset = int(request.args.get('offset', 0))
+        page_size = int(request.args.get('page_size', 100))
+        member_limit = int(request.args.get('member_limit', 100))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'offset, page_size and member_limit must be integers'})
+    if offset < 0 or not 1 <= page_size <= 1000 or member_limit < 0:
+        return jsonify({'success': False, 'message': 'offset must be >= 0 and page_size between 1 and 1000'})
+    
+    items, next_offset = backend.get_components_page(offset, page_size, member_limit)
+    return jsonify({
+        'success': True,
+        'components': [{'root': root, 'size': size, 'members': members} for root, size, members in items],
+        'count': backend.get_component_count(),
+        'offset': offset,
+        'next_offset': next_offset
+    })
+
+@app.route('/api/component/<person>')
+def get_component(person):
+    """Get the size and one page of the members of a person's component (?offset=&page_size=)"""
+    try:
+        offset = int(request.args.get('offset', 0))
+        page_size = int(request.args.get('page_size', 100))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'offset and page_size must be integers'})
+    if offset < 0 or not 1 <= page_size <= 1000:
+        return jsonify({'success': False, 'message': 'offset must be >= 0 and page_size between 1 and 1000'})
+    
+    if (component := backend.get_component(person, offset, page_size)) is None:
+        return jsonify({'success': False, 'message': f'{person} has no relationships'})
+    size, members, next_offset = component
     return jsonify({
         'success': True,
-        'components': components,
-        'count': len(components)
+        'person': person,
+        'size': size,
+        'members': members,
+        'offset': offset,
+        'next_offset': next_offset
     })
 
 if __name__ == '__main__':
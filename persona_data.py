@@ -1,13 +1,236 @@
-"""Persona metadata loader for the Friend Connection System."""
+"""Persona metadata loader for the Friend Connection System.
+
+Profiles are read on demand from an SQLite file (`persona_data.db`, built once with
+`python persona_data.py convert`), keeping only a bounded LRU of decoded profiles.
+Without the database, or if `persona_data.json` is newer, the JSON file is loaded
+into memory as before.
+"""
 
 from __future__ import annotations
 
+import hashlib
 import json
+import re
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
 
 # JSON data file that stores all persona information.
 DATA_FILE = Path(__file__).with_suffix(".json")
+# SQLite file converted from DATA_FILE (convert_to_sqlite).
+DB_FILE = Path(__file__).with_suffix(".db")
+
+# Persona fields covered by the keyword index (strings, or lists of strings).
+TEXT_FIELDS = ("title", "summary", "personality_traits", "pain_points", "goals", "technology", "system_insight")
+_WORD = re.compile(r"\w+")
+
+
+def _field_texts(value) -> list:
+    """Return the strings of a persona field (a list field gives one string per item)."""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, str)]
+    return []
+
+
+def _persona_words(persona: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+    """Yield the distinct (field, lowercase word) pairs of a persona."""
+    for field in TEXT_FIELDS:
+        words = set()
+        for text in _field_texts(persona.get(field)):
+            words.update(_WORD.findall(text.lower()))
+        for word in words:
+            yield field, word
+
+
+def build_keyword_index(personas: Dict[str, Any]) -> Dict[str, Dict[str, Set[str]]]:
+    """Build {field: {lowercase word: names of the personas using it in that field}}."""
+    index: Dict[str, Dict[str, Set[str]]] = {field: {} for field in TEXT_FIELDS}
+    for name, persona in personas.items():
+        for field, word in _persona_words(persona):
+            index[field].setdefault(word, set()).add(name)
+    return index
+
+
+# Fields of the compact view used by hover tooltips.
+TOOLTIP_FIELDS = ("id", "full_name", "title", "age")
+TOOLTIP_SUMMARY_LENGTH = 140
+
+
+def tooltip_view(persona: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the tooltip fields of a persona, with the summary already shortened."""
+    view = {field: persona.get(field) for field in TOOLTIP_FIELDS}
+    summary = persona.get("summary") or persona.get("system_insight") or ""
+    if len(summary) > TOOLTIP_SUMMARY_LENGTH:
+        summary = summary[:TOOLTIP_SUMMARY_LENGTH].strip() + "..."
+    view["summary"] = summary
+    return view
+
+
+class Persona_Store(ABC):
+    """Read access to the personas; subclasses say where the profiles are kept.
+
+    version identifies the persona data, so derived data can be cached per version.
+    """
+
+    version = ""
+
+    def __init__(self):
+        self.find = lru_cache(maxsize=1024)(self._find)
+
+    @abstractmethod
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Return the persona of name, or None."""
+
+    @abstractmethod
+    def names(self) -> List[str]:
+        """Return the names of every persona."""
+
+    @abstractmethod
+    def words(self, field: str, part: str) -> Set[str]:
+        """Return the names of the personas with a word containing part in field."""
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for name in self.names():
+            yield name, self.get(name)
+
+    def page(self, offset: int, count: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """Return (name, persona) of count personas from offset, in the order of names()."""
+        return [(name, self.get(name)) for name in self.names()[offset:offset + count]]
+
+    def _candidates(self, keyword: str, field: str) -> Iterable[str]:
+        """Return a superset of the personas whose field contains keyword.
+
+        Every word of a matching keyword is part of some word of the text, so only the
+        vocabulary is scanned, not the texts. A keyword without words gives everyone.
+        """
+        candidates = None
+        for part in set(_WORD.findall(keyword.lower())):
+            names = self.words(field, part)
+            candidates = names if candidates is None else candidates & names
+            if not candidates:
+                return ()
+        return self.names() if candidates is None else candidates
+
+    def _find(self, keyword: str, fields: tuple) -> FrozenSet[str]:
+        found = set()
+        for field in fields:
+            for name in self._candidates(keyword, field):
+                if name not in found and any(keyword in text for text in _field_texts((self.get(name) or {}).get(field))):
+                    found.add(name)
+        return frozenset(found)
+
+
+class Dict_Persona_Store(Persona_Store):
+    """Every persona in memory, the keyword index is built on the first search."""
+
+    def __init__(self, personas: Dict[str, Any], version: str = ""):
+        super().__init__()
+        self.personas = personas
+        self.version = version
+        self.index = None
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.personas.get(name)
+
+    def names(self) -> List[str]:
+        return list(self.personas)
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        return iter(self.personas.items())
+
+    def words(self, field: str, part: str) -> Set[str]:
+        if self.index is None:
+            self.index = build_keyword_index(self.personas)
+        return set().union(*(names for word, names in self.index[field].items() if part in word))
+
+
+class SQLite_Persona_Store(Persona_Store):
+    """Personas read on demand from a file written by convert_to_sqlite.
+
+    Up to cache_size decoded profiles are kept, the least recently used one is dropped first.
+    """
+
+    def __init__(self, path: Path = DB_FILE, cache_size: int = 256):
+        super().__init__()
+        self.path = Path(path)
+        self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self.lock = threading.Lock() # one query at a time on the connection
+        self.cache: OrderedDict = OrderedDict() # name -> decoded profile (None if unknown)
+        self.cache_size = cache_size
+        self.version = self._query("SELECT value FROM meta WHERE key = 'version'")[0][0]
+        self._names = None
+
+    def _query(self, sql: str, *args) -> list:
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            if name in self.cache:
+                self.cache.move_to_end(name)
+                return self.cache[name]
+        rows = self._query("SELECT data FROM personas WHERE name = ?", name)
+        persona = json.loads(rows[0][0]) if rows else None
+        with self.lock:
+            self.cache[name] = persona
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return persona
+
+    def names(self) -> List[str]:
+        if self._names is None:
+            self._names = [name for name, in self._query("SELECT name FROM personas ORDER BY rowid")]
+        return self._names
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        # decoded one by one without going through the cache, so listing everything keeps the hot profiles
+        for name, data in self._query("SELECT name, data FROM personas ORDER BY rowid"):
+            yield name, json.loads(data)
+
+    def page(self, offset: int, count: int) -> List[Tuple[str, Dict[str, Any]]]:
+        return [(name, json.loads(data)) for name, data in self._query(
+            "SELECT name, data FROM personas ORDER BY rowid LIMIT ? OFFSET ?", count, offset)]
+
+    def words(self, field: str, part: str) -> Set[str]:
+        return {name for name, in self._query(
+            "SELECT DISTINCT name FROM words WHERE field = ? AND instr(word, ?) > 0", field, part)}
+
+    def close(self):
+        self.conn.close()
+
+
+def convert_to_sqlite(json_path: Path = DATA_FILE, db_path: Path = DB_FILE) -> int:
+    """Write the personas of json_path to a new SQLite file at db_path, return how many."""
+    raw = Path(json_path).read_bytes()
+    personas = json.loads(raw)
+    tmp_path = Path(str(db_path) + ".tmp")
+    tmp_path.unlink(missing_ok=True)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE personas (name TEXT PRIMARY KEY, data TEXT NOT NULL);
+            CREATE TABLE words (field TEXT NOT NULL, word TEXT NOT NULL, name TEXT NOT NULL,
+                                PRIMARY KEY (field, word, name)) WITHOUT ROWID;
+        """)
+        conn.execute("INSERT INTO meta VALUES ('version', ?)", (hashlib.sha1(raw).hexdigest(),))
+        conn.executemany("INSERT INTO personas VALUES (?, ?)",
+                         ((name, json.dumps(persona, ensure_ascii=False)) for name, persona in personas.items()))
+        conn.executemany("INSERT INTO words VALUES (?, ?, ?)",
+                         ((field, word, name) for name, persona in personas.items()
+                          for field, word in _persona_words(persona)))
+        conn.commit()
+    finally:
+        conn.close()
+    tmp_path.replace(db_path)
+    return len(personas)
 
 
 def load_personas() -> Dict[str, Any]:
@@ -24,17 +247,95 @@ def load_personas() -> Dict[str, Any]:
         return {}
 
 
-# Cache personas at import so existing imports keep working.
-PERSONAS: Dict[str, Any] = load_personas()
+def open_store() -> Persona_Store:
+    """Use the SQLite file if it is at least as new as the JSON file, otherwise load the JSON file."""
+    if DB_FILE.exists() and (not DATA_FILE.exists() or DB_FILE.stat().st_mtime >= DATA_FILE.stat().st_mtime):
+        try:
+            return SQLite_Persona_Store(DB_FILE)
+        except sqlite3.Error as exc:
+            print(f"[persona_data] Failed to open {DB_FILE}: {exc}")
+    elif DB_FILE.exists():
+        print(f"[persona_data] {DB_FILE} is older than {DATA_FILE}, run `python persona_data.py convert`")
+    version = hashlib.sha1(DATA_FILE.read_bytes()).hexdigest() if DATA_FILE.exists() else ""
+    return Dict_Persona_Store(load_personas(), version)
+
+
+STORE: Persona_Store = open_store()
 
 
 def get_persona(name: str):
     """Return persona data for a given name if it exists."""
     if not name:
         return None
-    return PERSONAS.get(name)
+    return STORE.get(name)
 
 
 def get_all_personas() -> Dict[str, Any]:
-    """Return the entire persona mapping."""
-    return PERSONAS
+    """Return the entire persona mapping (decodes every profile of the SQLite store)."""
+    return dict(STORE.items())
+
+
+def _project(rows: List[Tuple[str, Dict[str, Any]]], fields: Optional[Iterable[str]],
+             view: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """Apply the view ("full" or "tooltip") and the field projection to (name, persona) rows."""
+    if view == "tooltip":
+        rows = [(name, tooltip_view(persona)) for name, persona in rows]
+    if fields is not None:
+        fields = list(fields)
+        rows = [(name, {field: persona[field] for field in fields if field in persona}) for name, persona in rows]
+    return rows
+
+
+def get_personas_page(offset: int, page_size: int, fields: Optional[Iterable[str]] = None,
+                      view: str = "full") -> Tuple[Dict[str, Any], Optional[int]]:
+    """Return ({name: persona}, next offset or None) for one page of personas.
+
+    view "tooltip" gives the compact tooltip_view instead of the full profile,
+    fields keeps only those keys of every persona.
+    """
+    rows = STORE.page(offset, page_size + 1)
+    next_offset = offset + page_size if len(rows) > page_size else None
+    return dict(_project(rows[:page_size], fields, view)), next_offset
+
+
+def get_personas(names: Iterable[str], fields: Optional[Iterable[str]] = None,
+                 view: str = "full") -> Dict[str, Any]:
+    """Return {name: persona} for the given names, names without a persona are left out.
+
+    Only these profiles are read, view and fields work like in get_personas_page.
+    """
+    rows = [(name, persona) for name in dict.fromkeys(names) if (persona := STORE.get(name))]
+    return dict(_project(rows, fields, view))
+
+
+def persona_count() -> int:
+    """Return the number of personas."""
+    return len(STORE.names())
+
+
+def persona_names() -> List[str]:
+    """Return the names of every persona."""
+    return STORE.names()
+
+
+def persona_version() -> str:
+    """Return the version (hash of the source data) of the personas."""
+    return STORE.version
+
+
+def find_personas(keyword: str, fields: tuple = ("summary",)) -> FrozenSet[str]:
+    """Return the names of the personas with keyword in one of fields.
+
+    Same result as testing `keyword in text` on every persona (case-sensitive, a list
+    field matches if one of its items contains keyword); the index only picks the
+    personas which are tested.
+    """
+    return STORE.find(keyword, fields)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["convert"]:
+        print("usage: python persona_data.py convert")
+        sys.exit(1)
+    count = convert_to_sqlite()
+    print(f"[persona_data] wrote {count} personas to {DB_FILE}")